@@ -1,7 +1,14 @@
+import concurrent.futures
+import functools
+import glob
+import io
+import os
 import sys
 
 from sly import Lexer, Parser
-from sag_types import Table, Column
+from sag_program import (Program, Number, Name, Operation,
+                         Import, Assign, Describe, Define, Limit, Output)
+from table_parser import LoadTable
 
 class SAGLLexer(Lexer):
 
@@ -11,7 +18,7 @@ class SAGLLexer(Lexer):
     STRING, NUMBER,
     PLUS, MINUS, TIMES, DIVIDE, EQUALS,
     LPAREN, RPAREN,
-    IMPORT, COLUMNS, BY,
+    IMPORT, COLUMNS, BY, FROM,
     DESCRIBE,
     DEFINE, TABLE, AS,
     LIMIT, BETWEEN,
@@ -44,6 +51,7 @@ class SAGLLexer(Lexer):
   NAME['IMPORT'] = IMPORT
   NAME['COLUMNS'] = COLUMNS
   NAME['BY'] = BY
+  NAME['FROM'] = FROM
   NAME['DESCRIBE'] = DESCRIBE
   NAME['DEFINE'] = DEFINE 
   NAME['TABLE'] = TABLE
@@ -73,28 +81,14 @@ class SAGLLexer(Lexer):
       self.index += 1
 
 
-# Program state manager
+# Backend operation names for the binary operators
+_OPERATIONS = {'+': 'Add', '-': 'Subtract', '*': 'Multiply', '/': 'Divide'}
+
+
+# Compiles a program to its statements, without evaluating any of them
 class SAGLParser(Parser):
 
   tokens = SAGLLexer.tokens
-  
-  def __init__(self, input_table, output_file):
-    super().__init__()
-    self.names = {}  # for storing variables
-    self.input_table = input_table
-    self.column_len = None
-    self.index_column = None
-    self.output_file = output_file
-    
-  def import_table(self, column_names):
-    lower_column_names = set(n.lower() for n in column_names)
-    self.names = {col.name.lower(): col for col in self.input_table.columns
-                  if col.name.lower() in lower_column_names}
-    if lower_column_names != self.names.keys():
-      raise ValueError("Could not find all named columns in the input table. Missing %s" % 
-                       ", ".join(lower_column_names-self.names.keys()))
-    self.index_column = self.names[column_names[0]]
-    self.column_len = len(self.index_column)
 
   precedence = (
     ('left','PLUS','MINUS'),
@@ -103,10 +97,15 @@ class SAGLParser(Parser):
     )
 
   # Top level rule, a program is a sequence of statements
-  @_('program statement',
-     'statement')
+  @_('program statement')
   def program(self, p):
-    pass
+    if p.statement is None:
+      return p.program
+    return p.program + [p.statement]
+
+  @_('statement')
+  def program(self, p):
+    return [] if p.statement is None else [p.statement]
 
   # Statements are all terminated by semicolons
   @_('import_ EOL',
@@ -116,12 +115,12 @@ class SAGLParser(Parser):
      'limit EOL',
      'output EOL')
   def statement(self, p):
-    pass
+    return p[0]
   
   # Resychronize on semicolons after finding syntax errors
   @_('error EOL')
   def statement(self, p):
-    pass
+    return None
 
   @_('namelist NAME')
   def namelist(self, p):
@@ -133,26 +132,28 @@ class SAGLParser(Parser):
 
   @_('IMPORT COLUMNS BY namelist')
   def import_(self, p):
-    self.import_table(p.namelist)
+    return Import(tuple(p.namelist), None, p.lineno)
+
+  # Selects a table from a multi-table input by index or title
+  @_('IMPORT COLUMNS BY namelist FROM TABLE NUMBER',
+     'IMPORT COLUMNS BY namelist FROM TABLE STRING')
+  def import_(self, p):
+    return Import(tuple(p.namelist), p[6], p.lineno)
   
   @_('NAME EQUALS expression')
   def assignment(self, p):
-    p.expression.name = p.NAME
-    self.names[p.NAME] = p.expression
+    return Assign(p.NAME, p.expression, p.lineno)
 
   @_('expression PLUS expression',
      'expression MINUS expression',
      'expression TIMES expression',
      'expression DIVIDE expression')
   def expression(self, p):
-    if   p[1] == '+': return p.expression0 + p.expression1
-    elif p[1] == '-': return p.expression0 - p.expression1
-    elif p[1] == '*': return p.expression0 * p.expression1
-    elif p[1] == '/': return p.expression0 / p.expression1
+    return Operation(_OPERATIONS[p[1]], (p.expression0, p.expression1))
 
   @_('MINUS expression %prec UMINUS')
   def expression(self, p):
-    return -p.expression
+    return Operation('Negate', (p.expression,))
 
   @_('LPAREN expression RPAREN')
   def expression(self, p):
@@ -160,70 +161,151 @@ class SAGLParser(Parser):
 
   @_('NUMBER')
   def expression(self, p):
-    return Column([p.NUMBER] * self.column_len)
+    return Number(p.NUMBER)
 
   @_('NAME')
   def expression(self, p):
-    try:
-      return self.names[p.NAME]
-    except LookupError:
-      print("Undefined name '%s'" % p.NAME)
+    return Name(p.NAME)
 
   @_('DESCRIBE NAME STRING')
   def describe(self, p):
-    try:
-      self.names[p.NAME].description = p.STRING
-    except LookupError:
-      print("Undefined name '%s'" % p.NAME)
+    return Describe(p.NAME, p.STRING, p.lineno)
 
   @_('DEFINE TABLE NAME AS namelist')
   def define(self, p):
-    try:
-      # TODO Check that all names refer to columns
-      columns = [self.names[column] for column in p.namelist]
-      self.names[p.NAME] = Table(columns)
-    except LookupError:
-      print("Undefined column while defining table '%s'" % p.NAME)
+    return Define(p.NAME, tuple(p.namelist), p.lineno)
 
   @_('LIMIT NAME BETWEEN NUMBER NUMBER')
   def limit(self, p):
-    try:
-      table = self.names[p.NAME]
-    except LookupError:
-      print("Undefined name '%s'" % p.NAME)
-      return
-      
-    if not isinstance(table, Table):
-      print("%s is not a table, cannot set limits" % p.NAME)
-      return
-    table.lower_bound = p.NUMBER0
-    table.upper_bound = p.NUMBER1
+    return Limit(p.NAME, p.NUMBER0, p.NUMBER1, p.lineno)
       
   @_('OUTPUT NAME')
   def output(self, p):
-    try:
-      table = self.names[p.NAME]
-    except LookupError:
-      print("Undefined name '%s'" % p.NAME)
-      return
-      
-    if not isinstance(table, Table):
-      print("%s is not a table, cannot output" % p.NAME)
-      return
-    
-    print(str(table), file=self.output_file)
-    # TODO Output legend after the table
+    return Output(p.NAME, p.lineno)
+
 
+def Compile(program, share_subexpressions=True):
+  """Compiles a SAGL program to a Program, which can be executed many times.
+
+  Syntax errors are reported and the statements containing them skipped.
+
+  Args:
+    program: A string containing the SAGL program
+    share_subexpressions: Whether to compile repeated subexpressions to be
+      computed once, see sag_program.EliminateCommonSubexpressions
+  """
+  statements = SAGLParser().parse(SAGLLexer().tokenize(program))
+  program = Program(statements or [])
+  if share_subexpressions:
+    program, _ = program.EliminateCommonSubexpressions()
+  return program
 
-def Evaluate(program, input_table, output_file=None):
+
+def Evaluate(program, input_table, output_file=None, backend=None,
+             deferred=False, measure_memory=False):
   """Evaluates a SAGL program on an input table and outputs to a file.
   
   Args:
-    program: A string containing the SAGL program to evaluate
-    input_table: The parsed Ruthen table to use as a data source
+    program: A string containing the SAGL program to evaluate, or a Program
+      compiled from one by Compile
+    input_table: The parsed Ruthen table to use as a data source, a RuthenFile
+      whose tables are parsed as they are imported, or a function
+      which takes the set of column names the program imports (see
+      Program.RequiredColumns) and returns the table, so that unused columns
+      need not be parsed
     output_file: A file-like object to write the output to
+    backend: The name of the column arithmetic backend, 'python' or 'numpy'.
+      Defaults to numpy when it is installed.
+    deferred: Whether to build assignments as an expression graph that is only
+      evaluated, with fused operator chains, when a table is output.
+    measure_memory: Whether to measure the column storage held after each
+      statement. Names are released as soon as no later statement needs them
+      either way.
+
+  Returns:
+    The peak bytes of column storage the program held between statements if
+    measure_memory is true, otherwise None.
+  """
+  if not isinstance(program, Program):
+    program = Compile(program)
+  return program.Execute(input_table, output_file, backend=backend,
+                         deferred=deferred, measure_memory=measure_memory)
+
+
+def _EvaluateInput(program, load, path, output_path, backend, deferred):
+  """Evaluates a compiled program on one input file, in a batch worker.
+
+  Returns:
+    The output text, or None when it was written to output_path.
   """
-  output_file = sys.stdout if output_file is None else output_file
-  lexer = SAGLLexer()
-  parser = SAGLParser(input_table, output_file)
-  parser.parse(lexer.tokenize(program))
+  input_table = functools.partial(load, path)
+  if output_path is not None:
+    with open(output_path, 'w') as output_file:
+      program.Execute(input_table, output_file, backend=backend, deferred=deferred)
+    return None
+  output_file = io.StringIO()
+  program.Execute(input_table, output_file, backend=backend, deferred=deferred)
+  return output_file.getvalue()
+
+
+def EvaluateBatch(program, inputs, output_file=None, output_dir=None,
+                  workers=None, load=None, backend=None, deferred=False):
+  """Evaluates one SAGL program on many input table files in a process pool.
+
+  The program is compiled once and sent to the workers, which each load and
+  evaluate whole input files.
+
+  Args:
+    program: A string containing the SAGL program to evaluate, or a Program
+      compiled from one by Compile
+    inputs: A list of input file paths, or a glob pattern matching them, which
+      are taken in sorted order
+    output_file: A file-like object the outputs are written to one after
+      another, in input order. Ignored when output_dir is given.
+    output_dir: If given, each input's output is written to a file in this
+      directory named after the input file, with a .csv suffix
+    workers: The number of processes to evaluate with, by default one per
+      CPU. With 1, inputs are evaluated in this process.
+    load: A picklable function taking an input path and the set of columns
+      the program imports and returning its input table. Defaults to
+      table_parser.LoadTable, opening RUTHEN files as RuthenFiles when the
+      program imports from a named table.
+    backend: The name of the column arithmetic backend, see Evaluate
+    deferred: Whether to defer column evaluation, see Evaluate
+
+  Returns:
+    The list of input paths, in the order they were evaluated and output.
+  """
+  if not isinstance(program, Program):
+    program = Compile(program)
+  if isinstance(inputs, str):
+    inputs = sorted(glob.glob(inputs))
+  if load is None:
+    load = functools.partial(LoadTable,
+                             table=0 if program.ImportedTables() else None)
+  output_paths = [None] * len(inputs)
+  if output_dir is not None:
+    output_paths = [os.path.join(output_dir, os.path.basename(path) + '.csv')
+                    for path in inputs]
+    if len(set(output_paths)) != len(output_paths):
+      raise ValueError("Inputs with the same file name would share an output file")
+    os.makedirs(output_dir, exist_ok=True)
+  elif output_file is None:
+    output_file = sys.stdout
+
+  arguments = [(program, load, path, output_path, backend, deferred)
+               for path, output_path in zip(inputs, output_paths)]
+  if workers == 1:
+    outputs = (_EvaluateInput(*a) for a in arguments)
+    _WriteOutputs(outputs, output_file)
+  else:
+    with concurrent.futures.ProcessPoolExecutor(max_workers=workers) as executor:
+      futures = [executor.submit(_EvaluateInput, *a) for a in arguments]
+      _WriteOutputs((future.result() for future in futures), output_file)
+  return list(inputs)
+
+def _WriteOutputs(outputs, output_file):
+  """Writes batch outputs, in order, to output_file as each becomes ready."""
+  for output in outputs:
+    if output is not None:
+      output_file.write(output)
@@ -0,0 +1,292 @@
+import functools
+import io
+import os
+import shutil
+import tempfile
+import unittest
+import sag_parser
+import sag_program
+import table_parser
+
+TESTDATA = os.path.join(os.path.dirname(__file__), 'testdata')
+
+def ReadTestdata(name):
+  with open(os.path.join(TESTDATA, name)) as f:
+    return f.read()
+
+class RequiredColumnsTest(unittest.TestCase):
+
+  def testImportedColumns(self):
+    program = 'IMPORT COLUMNS BY Age Foo; x = Foo + Bar; IMPORT COLUMNS BY Baz;'
+    self.assertEqual(sag_parser.Compile(program).RequiredColumns(), {'age', 'foo', 'baz'})
+
+  def testNoImport(self):
+    self.assertIsNone(sag_parser.Compile('x = 1;').RequiredColumns())
+
+  def testImportedTables(self):
+    program = 'IMPORT COLUMNS BY Age FROM TABLE 1; IMPORT COLUMNS BY Foo FROM TABLE "Bar";'
+    program = sag_parser.Compile(program)
+    self.assertEqual(program.ImportedTables(), [1.0, 'Bar'])
+    self.assertEqual(program.RequiredColumns(), {'age', 'foo'})
+
+
+class CompileTest(unittest.TestCase):
+
+  def testStatements(self):
+    program = sag_parser.Compile('IMPORT COLUMNS BY Age;\nx = -(Age + 2) * Age;\n'
+                                 'DEFINE TABLE t AS Age x; OUTPUT t;')
+    self.assertEqual(program.statements, (
+        sag_program.Import(('age',), None, 1),
+        sag_program.Assign('x', sag_program.Operation('Multiply', (
+            sag_program.Operation('Negate', (sag_program.Operation('Add', (
+                sag_program.Name('age'), sag_program.Number(2.0))),)),
+            sag_program.Name('age'))), 2),
+        sag_program.Define('t', ('age', 'x'), 3),
+        sag_program.Output('t', 3)))
+    self.assertEqual(program.RequiredColumns(), {'age'})
+
+  def testDeepExpression(self):
+    program = 'IMPORT COLUMNS BY Age Foo; x = %s; DEFINE TABLE t AS Age x; OUTPUT t;' % (
+        ' + '.join(['Foo'] * 1000))
+    statements = sag_parser.SAGLParser().parse(sag_parser.SAGLLexer().tokenize(program))
+    output = io.StringIO()
+    executor = sag_program.Executor(table_parser.ParseCSVTable('Age,Foo\n23,0.5\n'),
+                                    output, backend='python')
+    executor.Run(statements)
+    self.assertEqual(output.getvalue().splitlines()[-2], '23.0,500.0')
+
+  def testExecutesOnManyTables(self):
+    program = sag_parser.Compile('IMPORT COLUMNS BY Age Foo; x = Foo * 2;'
+                                 'DEFINE TABLE t AS Age x; OUTPUT t;')
+    for foo in ('0.25', '0.50'):
+      table = table_parser.ParseCSVTable('Age,Foo\n23,%s\n' % foo)
+      output = io.StringIO()
+      sag_parser.Evaluate(program, table, output, backend='python')
+      self.assertEqual(output.getvalue().splitlines()[-2], '23.0,%r' % (float(foo) * 2))
+
+
+class EliminateCommonSubexpressionsTest(unittest.TestCase):
+
+  PROGRAM = ('IMPORT COLUMNS BY Age Foo;\n'
+             'a = Age * Foo + 1;\n'
+             'b = Age * Foo;\n'
+             'alias = Age;\n'
+             'c = -(alias * Foo + 1);\n'
+             'Age = Foo;\n'
+             'd = Age * Foo;\n'
+             'DEFINE TABLE t AS Age a b c d;\n'
+             'OUTPUT t;')
+
+  def testSharesRepeatedOperations(self):
+    statements = sag_parser.SAGLParser().parse(sag_parser.SAGLLexer().tokenize(self.PROGRAM))
+    program, temporaries = sag_program.Program(statements).EliminateCommonSubexpressions()
+    product = sag_program.Operation('Multiply', (sag_program.Name('age'),
+                                                 sag_program.Name('foo')))
+    self.assertEqual(temporaries, [
+        sag_program.Assign('$1', product, 2),
+        sag_program.Assign('$2', sag_program.Operation('Add', (
+            sag_program.Name('$1'), sag_program.Number(1.0))), 2)])
+    self.assertEqual(program.statements[4], sag_program.Assign('b', sag_program.Name('$1'), 3))
+    self.assertEqual(program.statements[6].expression.operands, (sag_program.Name('$2'),))
+    self.assertEqual(program.statements[8], sag_program.Assign('d', product, 7))
+
+    table = table_parser.ParseCSVTable('Age,Foo\n23,0.25\n24,0.5\n')
+    for deferred in (False, True):
+      outputs = []
+      for p in (sag_program.Program(statements), program):
+        output = io.StringIO()
+        sag_parser.Evaluate(p, table, output, backend='python', deferred=deferred)
+        outputs.append(output.getvalue())
+      self.assertEqual(outputs[0], outputs[1])
+
+  def testCompileShares(self):
+    program = sag_parser.Compile(self.PROGRAM)
+    self.assertEqual(program.statements[1].name, '$1')
+    program = sag_parser.Compile(self.PROGRAM, share_subexpressions=False)
+    self.assertEqual(program.statements[1].name, 'a')
+
+  def testDeepExpression(self):
+    sum_ = ' + '.join(['Foo'] * 400)
+    program = sag_parser.Compile('IMPORT COLUMNS BY Age Foo; x = %s; y = %s + 1;'
+                                 'DEFINE TABLE t AS Age x y; OUTPUT t;' % (sum_, sum_))
+    self.assertEqual(program.statements[1].name, '$1')
+    output = io.StringIO()
+    sag_parser.Evaluate(program, table_parser.ParseCSVTable('Age,Foo\n23,0.5\n'),
+                        output, backend='python')
+    self.assertEqual(output.getvalue().splitlines()[-2], '23.0,200.0,201.0')
+
+
+class EliminateDeadColumnsTest(unittest.TestCase):
+
+  def testSkipsStatementsNotReachingOutput(self):
+    program = sag_parser.Compile(
+        'IMPORT COLUMNS BY Age Foo;\n'
+        'x = Foo * 2;\n'
+        'unused = x + 1;\n'
+        'DESCRIBE unused "never output";\n'
+        'alias = Foo;\n'
+        'DEFINE TABLE t AS Age x;\n'
+        'DESCRIBE x "described after the table is defined";\n'
+        'DEFINE TABLE scratch AS Age unused;\n'
+        'LIMIT scratch BETWEEN 1 2;\n'
+        'x = Age;\n'
+        'OUTPUT t;')
+    pruned, skipped = program.EliminateDeadColumns()
+    self.assertEqual([s.lineno for s in skipped], [3, 4, 5, 8, 9, 10])
+    table = table_parser.ParseCSVTable('Age,Foo\n23,0.25\n')
+    outputs = []
+    for p in (program, pruned):
+      output = io.StringIO()
+      sag_parser.Evaluate(p, table, output, backend='python')
+      outputs.append(output.getvalue())
+    self.assertEqual(outputs[0], outputs[1])
+
+  def testDeepExpression(self):
+    program = sag_parser.SAGLParser().parse(sag_parser.SAGLLexer().tokenize(
+        'IMPORT COLUMNS BY Age; x = %s; DEFINE TABLE t AS x; OUTPUT t;'
+        % ' + '.join(['Age'] * 1000)))
+    self.assertEqual(sag_program.LiveStatements(program), [True] * 4)
+
+  def testImportClearsNames(self):
+    program = sag_parser.Compile('x = 1; IMPORT COLUMNS BY Age; DEFINE TABLE t AS Age x;'
+                                 'IMPORT COLUMNS BY Age; OUTPUT t;')
+    _, skipped = program.EliminateDeadColumns()
+    self.assertEqual(skipped, [program.statements[0], program.statements[2]])
+
+
+class ReleasePointsTest(unittest.TestCase):
+
+  def testReleasesAfterLastUse(self):
+    program = sag_parser.Compile('IMPORT COLUMNS BY Age Foo Bar;\n'
+                                 'x = Foo * 2;\n'
+                                 'y = x + Foo;\n'
+                                 'DEFINE TABLE t AS Age y;\n'
+                                 'x = Age;\n'
+                                 'OUTPUT t;')
+    self.assertEqual(sag_program.ReleasePoints(program.statements),
+                     [{'bar'}, set(), {'x', 'foo'}, {'y'}, {'age', 'x'}, {'t'}])
+
+  def testLowersPeakMemory(self):
+    program = sag_parser.Compile('IMPORT COLUMNS BY Age Foo;\n'
+                                 'a = Foo * 2; b = a * 2; c = b * 2; d = c * 2;\n'
+                                 'DEFINE TABLE t AS Age d; OUTPUT t;')
+    table = table_parser.ParseCSVTable('Age,Foo\n' + '23,0.25\n' * 100)
+    self.assertIsNone(sag_parser.Evaluate(program, table, io.StringIO(), backend='python'))
+    peak_bytes = sag_parser.Evaluate(program, table, io.StringIO(), backend='python',
+                                     measure_memory=True)
+    executor = sag_program.Executor(table, io.StringIO(), backend='python',
+                                    measure_memory=True)
+    executor.Run(program.statements)
+    self.assertEqual(peak_bytes, 3 * 800)  # Age and two columns at a time
+    self.assertEqual(executor.peak_bytes, 6 * 800)
+
+    program = sag_parser.Compile('IMPORT COLUMNS BY Age Foo;\n'
+                                 'a = Foo * 2; a2 = a + a; b = a2 * 3; b2 = b + b;\n'
+                                 'c = b2 * 3; c2 = c + c;\n'
+                                 'DEFINE TABLE t AS Age c2; OUTPUT t;')
+    eager, deferred = [sag_parser.Evaluate(program, table, io.StringIO(), backend='python',
+                                           deferred=d, measure_memory=True)
+                       for d in (False, True)]
+    self.assertLessEqual(deferred, eager)
+
+
+class EvaluateTest(unittest.TestCase):
+
+  def setUp(self):
+    self.program = ReadTestdata('delayla3.sagl')
+    self.table_str = ReadTestdata('StackedArea-IncomeFlowsByAge.txt')
+
+  def Evaluate(self, **kwargs):
+    output = io.StringIO()
+    sag_parser.Evaluate(self.program, table_parser.ParseRuthenTable(self.table_str),
+                        output, **kwargs)
+    return output.getvalue()
+
+  def testOutputsTables(self):
+    output = self.Evaluate(backend='python')
+    self.assertTrue(output.startswith('Composition of constant dollar consumption\n'))
+    self.assertIn('Total real income sources\n', output)
+    self.assertIn('Consumption = total inflows less income and sales taxes\n', output)
+
+  def testInputTableNotModified(self):
+    table = table_parser.ParseRuthenTable(self.table_str)
+    expected = [(c.name, c.description) for c in table.columns]
+    sag_parser.Evaluate(self.program, table, io.StringIO(), backend='python')
+    sag_parser.Evaluate('IMPORT COLUMNS BY Age; DESCRIBE Age "changed";', table,
+                        io.StringIO(), backend='python')
+    self.assertEqual([(c.name, c.description) for c in table.columns], expected)
+
+  def testProjectedLoader(self):
+    requested = []
+    def Load(columns):
+      requested.append(columns)
+      return table_parser.ParseRuthenTable(self.table_str, columns=columns)
+    output = io.StringIO()
+    sag_parser.Evaluate(self.program, Load, output, backend='python')
+    self.assertEqual(len(requested[0]), 14)
+    self.assertEqual(output.getvalue(), self.Evaluate(backend='python'))
+
+  def testImportFromRuthenFile(self):
+    path = os.path.join(TESTDATA, 'StackedArea-IncomeFlowsByAge.txt')
+    program = self.program.replace(';', ' FROM TABLE "means by age";', 1)
+    output = io.StringIO()
+    sag_parser.Evaluate(program, table_parser.RuthenFile(path), output, backend='python')
+    self.assertEqual(output.getvalue(), self.Evaluate(backend='python'))
+
+  def testImportFromSingleTable(self):
+    self.program = 'IMPORT COLUMNS BY Age FROM TABLE 1;'
+    with self.assertRaises(ValueError):
+      self.Evaluate(backend='python')
+
+  def testTableAlias(self):
+    program = 'IMPORT COLUMNS BY Age Foo; DEFINE TABLE u AS Age Foo; t = u; OUTPUT t;'
+    table = table_parser.ParseCSVTable('Age,Foo\n23,0.25\n')
+    output = io.StringIO()
+    sag_parser.Evaluate(program, table, output, backend='python')
+    self.assertEqual(output.getvalue().splitlines(), ['Age,Foo', '23.0,0.25', ''])
+
+  def testDeferredMatchesEager(self):
+    self.assertEqual(self.Evaluate(backend='python', deferred=True),
+                     self.Evaluate(backend='python'))
+
+
+class EvaluateBatchTest(unittest.TestCase):
+
+  def setUp(self):
+    self.directory = tempfile.mkdtemp()
+    self.program = 'IMPORT COLUMNS BY Age Foo; DEFINE TABLE t AS Age Foo; OUTPUT t;'
+    self.paths = []
+    for name, foo in (('b.csv', 2), ('a.csv', 1), ('c.csv', 3)):
+      self.paths.append(os.path.join(self.directory, name))
+      with open(self.paths[-1], 'w') as f:
+        f.write('Age,Foo\n23,%d\n' % foo)
+    self.load = functools.partial(table_parser.LoadTable, csv=True)
+
+  def tearDown(self):
+    shutil.rmtree(self.directory)
+
+  def Output(self, path):
+    output = io.StringIO()
+    sag_parser.Evaluate(self.program, self.load(path), output, backend='python')
+    return output.getvalue()
+
+  def testStreamsInInputOrder(self):
+    output = io.StringIO()
+    evaluated = sag_parser.EvaluateBatch(self.program, self.paths, output,
+                                         workers=2, load=self.load, backend='python')
+    self.assertEqual(evaluated, self.paths)
+    self.assertEqual(output.getvalue(), ''.join(map(self.Output, self.paths)))
+
+  def testGlobToOutputDirectory(self):
+    output_dir = os.path.join(self.directory, 'out')
+    evaluated = sag_parser.EvaluateBatch(self.program, os.path.join(self.directory, '*.csv'),
+                                         output_dir=output_dir, workers=1,
+                                         load=self.load, backend='python')
+    self.assertEqual(evaluated, sorted(self.paths))
+    for path in self.paths:
+      with open(os.path.join(output_dir, os.path.basename(path) + '.csv'), newline='') as f:
+        self.assertEqual(f.read(), self.Output(path))
+
+
+if __name__ == '__main__':
+  unittest.main()
@@ -0,0 +1,477 @@
+import collections
+import sys
+
+from sag_types import (Table, Scalar, DeferredColumn, Defer, GetBackend, LiveBytes,
+                       _COLUMN_OPERATIONS)
+from table_parser import RuthenFile
+
+
+# Expressions
+
+class Number(collections.namedtuple('Number', 'value')):
+  """A numeric literal."""
+  __slots__ = ()
+
+class Name(collections.namedtuple('Name', 'name')):
+  """A reference to a named column."""
+  __slots__ = ()
+
+class Operation(collections.namedtuple('Operation', 'operation operands')):
+  """A backend operation, e.g. 'Add' or 'Negate', applied to operand expressions."""
+  __slots__ = ()
+
+
+# Statements, each recording the line it starts on
+
+class Import(collections.namedtuple('Import', 'columns table lineno')):
+  """IMPORT COLUMNS BY columns [FROM TABLE table]."""
+  __slots__ = ()
+
+class Assign(collections.namedtuple('Assign', 'name expression lineno')):
+  """name = expression."""
+  __slots__ = ()
+
+class Describe(collections.namedtuple('Describe', 'name description lineno')):
+  """DESCRIBE name description."""
+  __slots__ = ()
+
+class Define(collections.namedtuple('Define', 'name columns lineno')):
+  """DEFINE TABLE name AS columns."""
+  __slots__ = ()
+
+class Limit(collections.namedtuple('Limit', 'name lower upper lineno')):
+  """LIMIT name BETWEEN lower upper."""
+  __slots__ = ()
+
+class Output(collections.namedtuple('Output', 'name lineno')):
+  """OUTPUT name."""
+  __slots__ = ()
+
+
+def Names(expression):
+  """Returns the names an expression reads, in order of appearance."""
+  names = []
+  pending = [expression]
+  while pending:
+    node = pending.pop()
+    if isinstance(node, Name):
+      names.append(node.name)
+    elif isinstance(node, Operation):
+      pending.extend(reversed(node.operands))
+  return names
+
+
+def LiveStatements(statements):
+  """Finds the statements whose effects can reach an OUTPUT.
+
+  Every assignment and table definition binds a name to a new column or
+  table, so the analysis follows bindings rather than names: a binding is
+  live if an OUTPUT reads it or a live binding was computed from it.
+  Assignments and definitions of dead bindings, and DESCRIBE and LIMIT
+  statements changing them, have no effect on the output. Imports and
+  outputs are always live.
+
+  Returns:
+    A list holding, for each statement, whether it is live.
+  """
+  bindings = {}  # name -> index of the statement binding it
+  reads = {}  # binding -> the bindings computed from
+  targets = []  # for each statement, the binding it uses or changes
+  for i, statement in enumerate(statements):
+    target = None
+    if isinstance(statement, Import):
+      bindings = {name: i for name in statement.columns}
+    elif isinstance(statement, (Assign, Define)):
+      if isinstance(statement, Assign):
+        names = Names(statement.expression)
+      else:
+        names = statement.columns
+      reads[i] = [bindings[n] for n in names if n in bindings]
+      bindings[statement.name] = target = i
+    else:
+      target = bindings.get(statement.name)
+    targets.append(target)
+
+  live = set()
+  pending = [t for s, t in zip(statements, targets)
+             if isinstance(s, Output) and t is not None]
+  while pending:
+    binding = pending.pop()
+    if binding not in live:
+      live.add(binding)
+      pending.extend(reads.get(binding, ()))
+  return [isinstance(s, (Import, Output)) or t in live
+          for s, t in zip(statements, targets)]
+
+
+def _Reads(statement):
+  """Returns the names a statement reads or changes."""
+  if isinstance(statement, Assign):
+    return Names(statement.expression)
+  if isinstance(statement, Define):
+    return list(statement.columns)
+  if isinstance(statement, (Describe, Limit, Output)):
+    return [statement.name]
+  return []
+
+def ReleasePoints(statements):
+  """Finds where each name's column is last needed, by liveness analysis.
+
+  A name is live after a statement if a later statement reads it before it
+  is reassigned or cleared by an import. Tables keep references to their own
+  columns, so releasing a column's name frees it only once no live table
+  holds it either.
+
+  Returns:
+    A list holding, for each statement, the names which are dead after it.
+  """
+  releases = []
+  live = set()
+  for statement in reversed(statements):
+    if isinstance(statement, Import):
+      bound = set(statement.columns)
+      releases.append(bound - live)
+      live = set()
+      continue
+    reads = set(_Reads(statement))
+    bound = {statement.name} if isinstance(statement, (Assign, Define)) else set()
+    releases.append((reads | bound) - live)
+    live = (live - bound) | reads
+  releases.reverse()
+  return releases
+
+def _Bind(statement, index, bindings):
+  """Updates the value numbers of names after a statement.
+
+  Returns:
+    The bindings, which are replaced rather than updated by imports.
+  """
+  if isinstance(statement, Import):
+    return {name: (index, name) for name in statement.columns}
+  if isinstance(statement, Assign) and isinstance(statement.expression, Name):
+    # An alias views the same values as the name it copies
+    bindings[statement.name] = bindings.get(statement.expression.name, index)
+  elif isinstance(statement, (Assign, Define)):
+    bindings[statement.name] = index
+  return bindings
+
+def _ValueNumbers(expression, bindings, numbering, named):
+  """Numbers every node of an expression, bottom-up in one pass.
+
+  Nodes are hashed structurally: a number by its value, a name by the value
+  number it is bound to, so that aliases of one column share numbers while
+  reassigned names do not, and an operation by its operation and its
+  operands' numbers. Keys equal to earlier ones share their number.
+
+  Args:
+    expression: The expression to number
+    bindings: The value numbers of names, see _Bind
+    numbering: The numbers of all keys seen so far, which is extended
+    named: The set of numbers of nodes which read a name, which is extended
+
+  Returns:
+    A dict from the id of each node in expression to its number.
+  """
+  numbers = {}
+  pending = [(expression, False)]
+  while pending:
+    node, reduced = pending.pop()
+    if isinstance(node, Number):
+      key = ('number', node.value)
+    elif isinstance(node, Name):
+      key = ('name', bindings.get(node.name, node.name))
+    elif not reduced:
+      pending.append((node, True))
+      pending.extend((operand, False) for operand in node.operands)
+      continue
+    else:
+      key = (node.operation,) + tuple(numbers[id(o)] for o in node.operands)
+    number = numbers[id(node)] = numbering.setdefault(key, len(numbering))
+    if isinstance(node, Name) or (isinstance(node, Operation) and
+                                  any(numbers[id(o)] in named for o in node.operands)):
+      named.add(number)
+  return numbers
+
+
+def _Operations(expression):
+  """Returns every Operation within an expression."""
+  operations = []
+  pending = [expression]
+  while pending:
+    node = pending.pop()
+    if isinstance(node, Operation):
+      operations.append(node)
+      pending.extend(node.operands)
+  return operations
+
+
+def EliminateCommonSubexpressions(statements):
+  """Computes each repeated subexpression once, assigning it to a temporary.
+
+  Operations are hashed structurally, keyed on the operation and the columns
+  their operands are bound to (see _ValueNumbers). An operation on columns
+  which occurs more than once, other than only within a larger repeated
+  operation, is assigned to a temporary just before the statement it first
+  occurs in, and every occurrence reads the temporary instead. Temporaries
+  are named '$1', '$2'... which no program can assign.
+
+  Returns:
+    A tuple of the rewritten statements and the temporary assignments added.
+  """
+  numbering = {}
+  named = set()
+  numbers = []  # for each statement, the numbers of its expression's nodes
+  counts = collections.Counter()
+  bindings = {}
+  for i, statement in enumerate(statements):
+    if isinstance(statement, Assign):
+      numbers.append(_ValueNumbers(statement.expression, bindings, numbering, named))
+      counts.update(numbers[-1][id(o)] for o in _Operations(statement.expression))
+    else:
+      numbers.append(None)
+    bindings = _Bind(statement, i, bindings)
+
+  temporaries = {}  # number -> name of the temporary holding it
+  hoisted = []
+  rewritten = []
+  for statement, statement_numbers in zip(statements, numbers):
+    if isinstance(statement, Assign):
+      first = len(hoisted)
+      results = []
+      pending = [(statement.expression, 0, False)]
+      while pending:
+        node, parent_count, reduced = pending.pop()
+        if not isinstance(node, Operation):
+          results.append(node)
+          continue
+        number = statement_numbers[id(node)]
+        count = counts[number]
+        shared = count >= 2 and count != parent_count and number in named
+        if not reduced:
+          if shared and number in temporaries:
+            results.append(Name(temporaries[number]))
+          else:
+            pending.append((node, parent_count, True))
+            pending.extend((o, count, False) for o in reversed(node.operands))
+          continue
+        operands = tuple(results[len(results) - len(node.operands):])
+        del results[len(results) - len(node.operands):]
+        expression = Operation(node.operation, operands)
+        if shared:
+          temporary = Assign('$%d' % (len(hoisted) + 1), expression, statement.lineno)
+          temporaries[number] = temporary.name
+          hoisted.append(temporary)
+          expression = Name(temporary.name)
+        results.append(expression)
+      rewritten.extend(hoisted[first:])
+      statement = Assign(statement.name, results[0], statement.lineno)
+    rewritten.append(statement)
+  return rewritten, hoisted
+
+
+class Program(object):
+  """A compiled SAGL program, as a sequence of statements.
+
+  A program holds no table data, so it is compiled once and may then be
+  executed against any number of input tables.
+  """
+
+  def __init__(self, statements):
+    self.statements = tuple(statements)
+
+  def ImportedTables(self):
+    """Returns the table indexes and titles named by IMPORT ... FROM TABLE."""
+    return [s.table for s in self.statements
+            if isinstance(s, Import) and s.table is not None]
+
+  def RequiredColumns(self):
+    """Returns the set of imported column names, or None if nothing is imported."""
+    imports = [s for s in self.statements if isinstance(s, Import)]
+    if not imports:
+      return None
+    return set(name for s in imports for name in s.columns)
+
+  def EliminateDeadColumns(self):
+    """Removes the statements that no OUTPUT depends on. See LiveStatements.
+
+    Returns:
+      A tuple of the program without those statements and a list of the
+      statements removed.
+    """
+    live = LiveStatements(self.statements)
+    return (Program(s for s, l in zip(self.statements, live) if l),
+            [s for s, l in zip(self.statements, live) if not l])
+
+  def EliminateCommonSubexpressions(self):
+    """Shares repeated subexpressions. See EliminateCommonSubexpressions.
+
+    Returns:
+      A tuple of the rewritten program and the temporary assignments added.
+    """
+    statements, temporaries = EliminateCommonSubexpressions(self.statements)
+    return Program(statements), temporaries
+
+  def Execute(self, input_table, output_file=None, backend=None, deferred=False,
+              measure_memory=False):
+    """Executes the program on an input table. See sag_parser.Evaluate.
+
+    Each name is released as soon as no later statement needs it, see
+    ReleasePoints.
+
+    Returns:
+      The peak bytes of column storage held by names if measure_memory is
+      true, see Executor, otherwise None.
+    """
+    output_file = sys.stdout if output_file is None else output_file
+    if callable(input_table):
+      input_table = input_table(self.RequiredColumns())
+    executor = Executor(input_table, output_file, backend=backend,
+                        deferred=deferred, measure_memory=measure_memory)
+    executor.Run(self.statements, ReleasePoints(self.statements))
+    return executor.peak_bytes
+
+  def __repr__(self):
+    return 'Program(%r)' % (self.statements,)
+
+
+class Executor(object):
+  """Runs program statements against one input table.
+
+  Attributes:
+    names: The columns and tables assigned so far, by lowercase name.
+    peak_bytes: The most bytes of column storage reachable from names after
+      any statement, see sag_types.LiveBytes, or None unless measure_memory
+      was given.
+  """
+
+  def __init__(self, input_table, output_file, backend=None, deferred=False,
+               measure_memory=False):
+    self.names = {}  # for storing variables
+    self.input_table = input_table
+    self.column_len = None
+    self.index_column = None
+    self.output_file = output_file
+    self.backend = GetBackend(backend)
+    self.deferred = deferred  # build DeferredColumns instead of evaluating
+    self.peak_bytes = 0 if measure_memory else None
+
+  def Run(self, statements, releases=None):
+    """Executes statements in order.
+
+    Args:
+      statements: The statements to execute
+      releases: If given, for each statement the names to release after it
+    """
+    for i, statement in enumerate(statements):
+      getattr(self, type(statement).__name__)(statement)
+      if self.peak_bytes is not None:
+        self.peak_bytes = max(self.peak_bytes, LiveBytes(self.names.values()))
+      for name in releases[i] if releases is not None else ():
+        self.names.pop(name, None)
+
+  def Evaluate(self, expression):
+    """Returns the Column an expression evaluates to.
+
+    The tree is evaluated in post-order with an explicit stack, like the
+    parser's own bottom-up reductions, so long chains of operators don't
+    recurse.
+    """
+    values = []
+    pending = [(expression, False)]
+    while pending:
+      node, reduced = pending.pop()
+      if isinstance(node, Number):
+        values.append(Scalar(node.value))
+      elif isinstance(node, Name):
+        values.append(self._Lookup(node.name))
+      elif not reduced:
+        pending.append((node, True))
+        pending.extend((operand, False) for operand in reversed(node.operands))
+      else:
+        operands = values[len(values) - len(node.operands):]
+        del values[len(values) - len(node.operands):]
+        if self.deferred:
+          values.append(Defer(node.operation, *operands))
+        else:
+          values.append(_COLUMN_OPERATIONS[node.operation](*operands))
+    return values[0]
+
+  def _Lookup(self, name):
+    """Returns the column bound to name, or None after reporting it undefined."""
+    try:
+      return self.names[name]
+    except LookupError:
+      print("Undefined name '%s'" % name)
+      return None
+
+  def Import(self, statement):
+    column_names = statement.columns
+    input_table = self.input_table
+    if isinstance(input_table, RuthenFile):
+      input_table = input_table.Table(statement.table, columns=column_names)
+    elif statement.table is not None:
+      raise ValueError("Cannot import from table %r, the input has a single table"
+                       % statement.table)
+    lower_column_names = set(n.lower() for n in column_names)
+    self.names = {col.name.lower(): col.ToBackend(self.backend).View()
+                  for col in input_table.columns
+                  if col.name.lower() in lower_column_names}
+    if lower_column_names != self.names.keys():
+      raise ValueError("Could not find all named columns in the input table. Missing %s" %
+                       ", ".join(lower_column_names-self.names.keys()))
+    self.index_column = self.names[column_names[0]]
+    self.column_len = len(self.index_column)
+
+  def Assign(self, statement):
+    column = self.Evaluate(statement.expression)
+    if isinstance(column, Table):
+      self.names[statement.name] = column  # tables are aliased unchanged
+    elif column.name is None:
+      column.name = statement.name  # a new column that nothing else refers to
+      self.names[statement.name] = column
+    else:
+      self.names[statement.name] = column.View(statement.name)
+
+  def Describe(self, statement):
+    try:
+      self.names[statement.name].description = statement.description
+    except LookupError:
+      print("Undefined name '%s'" % statement.name)
+
+  def Define(self, statement):
+    try:
+      # TODO Check that all names refer to columns
+      columns = [self.names[column] for column in statement.columns]
+      columns = [c.Broadcast(self.column_len, self.backend)
+                 if isinstance(c, Scalar) else c for c in columns]
+      for column in columns:
+        if isinstance(column, DeferredColumn):
+          column.uses += 1
+      self.names[statement.name] = Table(columns)
+    except LookupError:
+      print("Undefined column while defining table '%s'" % statement.name)
+
+  def Limit(self, statement):
+    table = self._Table(statement.name, "cannot set limits")
+    if table is not None:
+      table.lower_bound = statement.lower
+      table.upper_bound = statement.upper
+
+  def Output(self, statement):
+    table = self._Table(statement.name, "cannot output")
+    if table is not None:
+      table.Write(self.output_file)
+      print(file=self.output_file)
+      # TODO Output legend after the table
+
+  def _Table(self, name, action):
+    """Returns the named table, or None after reporting why there is none."""
+    try:
+      table = self.names[name]
+    except LookupError:
+      print("Undefined name '%s'" % name)
+      return None
+    if not isinstance(table, Table):
+      print("%s is not a table, %s" % (name, action))
+      return None
+    return table
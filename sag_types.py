@@ -1,12 +1,213 @@
+import bisect
 import csv
 import io
+import itertools
+import operator
+from array import array
+
+
+try:
+  import numpy
+except ImportError:
+  numpy = None
+
+
+def _Divide(a, b):
+  return a/b if b!=0 else float('nan')
+
+
+def _Rows(operand):
+  """Returns an iterable of operand's rows, repeating scalars indefinitely."""
+  if isinstance(operand, float):
+    return itertools.repeat(operand)
+  return operand
+
+
+class PythonBackend(object):
+  """Pure Python column arithmetic over array('d') buffers.
+
+  Read-only memoryviews of doubles, such as memory-mapped table snapshots, are
+  also accepted as buffers without copying. Either operand of a binary
+  operation may be a float, which is broadcast.
+  """
+
+  name = 'python'
+
+  def Buffer(self, value):
+    """Returns value as a float64 array, copying only if needed."""
+    if ((isinstance(value, array) and value.typecode == 'd')
+        or (isinstance(value, memoryview) and value.format == 'd')):
+      return value
+    return array('d', value)
+
+  def Add(self, a, b):
+    return array('d', map(operator.add, _Rows(a), _Rows(b)))
+
+  def Subtract(self, a, b):
+    return array('d', map(operator.sub, _Rows(a), _Rows(b)))
+
+  def Multiply(self, a, b):
+    return array('d', map(operator.mul, _Rows(a), _Rows(b)))
+
+  def Divide(self, a, b):
+    return array('d', map(_Divide, _Rows(a), _Rows(b)))
+
+  def Negate(self, a):
+    return array('d', map(operator.neg, a))
+
+  def Equal(self, a, b):
+    return len(a) == len(b) and all(map(operator.eq, a, b))
+
+  def IsSorted(self, a):
+    return all(map(operator.le, a, itertools.islice(a, 1, None)))
+
+  def Range(self, a, lower, upper):
+    """Returns the [start, stop) rows of sorted a within [lower, upper]."""
+    start = 0 if lower is None else bisect.bisect_left(a, lower)
+    stop = len(a) if upper is None else bisect.bisect_right(a, upper)
+    return start, max(start, stop)
+
+  def Window(self, a, start, stop):
+    """Returns rows [start, stop) of a without copying."""
+    return memoryview(a)[start:stop]
+
+  def Fused(self, column):
+    """Computes a deferred column in a single pass over the rows.
+
+    The inlined part of the expression is compiled to one Python function of
+    a row's leaf values, so no intermediate buffers are allocated.
+    """
+    leaves = {}
+    namespace = {'_Divide': _Divide}
+    def Source(c):
+      if column.Inlines(c):
+        return _FUSED_TEMPLATES[c.operation] % tuple(map(Source, c.operands))
+      if isinstance(c, Scalar):
+        constant = 'c%d' % len(namespace)
+        namespace[constant] = c.value
+        return constant
+      buffer = c.value
+      return leaves.setdefault(id(buffer), ('x%d' % len(leaves), buffer))[0]
+    body = Source(column)
+    row_function = eval('lambda %s: %s' % (', '.join(n for n, _ in leaves.values()), body),
+                        namespace)
+    return array('d', map(row_function, *(b for _, b in leaves.values())))
+
+
+class NumpyBackend(object):
+  """Vectorized column arithmetic over float64 numpy arrays.
+
+  Either operand of a binary operation may be a float, which is broadcast.
+  """
+
+  name = 'numpy'
+
+  def Buffer(self, value):
+    """Returns value as a float64 ndarray, sharing memory when possible."""
+    if hasattr(value, '__len__'):
+      return numpy.asarray(value, dtype=numpy.float64)
+    return numpy.fromiter(value, dtype=numpy.float64)
+
+  def Add(self, a, b):
+    return numpy.add(a, b)
+
+  def Subtract(self, a, b):
+    return numpy.subtract(a, b)
+
+  def Multiply(self, a, b):
+    return numpy.multiply(a, b)
+
+  def Divide(self, a, b):
+    """Divides elementwise, producing NaN wherever the divisor is zero."""
+    b = numpy.asarray(b, dtype=numpy.float64)
+    out = numpy.full(numpy.broadcast(a, b).shape, numpy.nan)
+    return numpy.divide(a, b, out=out, where=b!=0)
+
+  def Negate(self, a):
+    return numpy.negative(a)
+
+  def Equal(self, a, b):
+    return numpy.array_equal(a, b)
+
+  def IsSorted(self, a):
+    return bool(numpy.all(a[:-1] <= a[1:]))
+
+  def Range(self, a, lower, upper):
+    """Returns the [start, stop) rows of sorted a within [lower, upper]."""
+    start = 0 if lower is None else int(numpy.searchsorted(a, lower, 'left'))
+    stop = len(a) if upper is None else int(numpy.searchsorted(a, upper, 'right'))
+    return start, max(start, stop)
+
+  def Window(self, a, start, stop):
+    """Returns rows [start, stop) of a without copying."""
+    return a[start:stop]
+
+  def Fused(self, column):
+    """Computes a deferred column, releasing intermediates as soon as used."""
+    def Evaluate(c):
+      if column.Inlines(c):
+        return getattr(self, c.operation)(*map(Evaluate, c.operands))
+      return c.value
+    return Evaluate(column)
+
+
+BACKENDS = {'python': PythonBackend()}
+if numpy is not None:
+  BACKENDS['numpy'] = NumpyBackend()
+
+
+def GetBackend(name=None):
+  """Returns the column backend with the given name.
+
+  Args:
+    name: 'python', 'numpy', or None to use numpy when it is installed and
+      fall back to pure Python otherwise.
+  """
+  if name is None:
+    return BACKENDS.get('numpy', BACKENDS['python'])
+  try:
+    return BACKENDS[name]
+  except LookupError:
+    raise ValueError("Unknown or unavailable column backend '%s'" % name)
+
+
+def _BackendOf(*buffers):
+  """Returns the backend that owns the given buffers."""
+  if numpy is not None and any(isinstance(b, numpy.ndarray) for b in buffers):
+    return BACKENDS['numpy']
+  return BACKENDS['python']
+
 
 class Column(object):
+  """A named column of floats.
 
-  def __init__(self, value, name=None, description=None):
+  Values are stored in a compact buffer owned by a backend: an array('d') for
+  the pure Python backend or a float64 ndarray for the numpy backend. Any
+  iterable of numbers may be passed in and is converted once.
+  """
+
+  def __init__(self, value, name=None, description=None, backend=None):
     self.name = name
-    self.value = value
+    if backend is None:
+      backend = _BackendOf(value)
+    self.value = backend.Buffer(value)
     self.description = description
+
+  @property
+  def backend(self):
+    return _BackendOf(self.value)
+
+  def ToBackend(self, backend):
+    """Returns this column with its values held by the given backend."""
+    if self.backend is backend:
+      return self
+    return Column(self.value, name=self.name, description=self.description,
+                  backend=backend)
+
+  def View(self, name=None):
+    """Returns a ColumnView of this column, renamed if name is given."""
+    return ColumnView(self, self.name if name is None else name,
+                      self.description)
     
   def __len__(self):
     return len(self.value)
@@ -17,31 +218,290 @@ class Column(object):
   def __iter__(self):
     return iter(self.value)
     
+  def _Binary(self, other, operation):
+    if isinstance(self, Scalar) and isinstance(other, Scalar):
+      return Scalar(_SCALAR_OPERATIONS[operation](self.value, other.value))
+    backend = _BackendOf(self.value, other.value)
+    return Column(getattr(backend, operation)(self.value, other.value))
+
   def __add__(self, other):
-    return Column([a+b for a, b in zip(self.value, other.value)])
+    return self._Binary(other, 'Add')
     
   def __sub__(self, other):
-    return Column([a-b for a, b in zip(self.value, other.value)])
+    return self._Binary(other, 'Subtract')
     
   def __mul__(self, other):
-    return Column([a*b for a, b in zip(self.value, other.value)])
+    return self._Binary(other, 'Multiply')
     
   def __truediv__(self, other):
-    return Column([a/b if b!=0 else float('nan') for a, b in zip(self.value, other.value)])
+    return self._Binary(other, 'Divide')
     
   def __neg__(self):
-    return Column([-a for a in self.value], self.description)
+    return Column(self.backend.Negate(self.value), self.description)
     
   def __repr__(self):
     return 'Column(%r, name=%r, description=%r)' % (self.value, self.name, self.description)
     
   def __eq__(self, other):
-    return (self.value == other.value
+    return (_BackendOf(self.value, other.value).Equal(self.value, other.value)
             and self.name == other.name
             and self.description == other.description)
 
 
+_SCALAR_OPERATIONS = {
+  'Add': operator.add,
+  'Subtract': operator.sub,
+  'Multiply': operator.mul,
+  'Divide': _Divide,
+}
+
+
+class Scalar(Column):
+  """A constant column that broadcasts one value to every row.
+
+  Scalars take part in all Column operators without allocating per-row
+  storage, and operations between two scalars fold to a new Scalar.
+  """
+
+  def __init__(self, value, name=None, description=None):
+    self.name = name
+    self.value = float(value)
+    self.description = description
+
+  def ToBackend(self, backend):
+    return self
+
+  def View(self, name=None):
+    return Scalar(self.value, self.name if name is None else name,
+                  self.description)
+
+  def Broadcast(self, length, backend=None):
+    """Returns a Column holding this value repeated length times."""
+    return Column([self.value] * length, name=self.name,
+                  description=self.description, backend=backend)
+
+  def __len__(self):
+    raise TypeError("Scalar column has no length")
+
+  def __getitem__(self, key):
+    return self.value
+
+  def __iter__(self):
+    return itertools.repeat(self.value)
+
+  def __neg__(self):
+    return Scalar(-self.value)
+
+  def __repr__(self):
+    return 'Scalar(%r, name=%r, description=%r)' % (self.value, self.name, self.description)
+
+  def __eq__(self, other):
+    return (isinstance(other, Scalar)
+            and self.value == other.value
+            and self.name == other.name
+            and self.description == other.description)
+
+
+_FUSED_TEMPLATES = {
+  'Add': '(%s+%s)',
+  'Subtract': '(%s-%s)',
+  'Multiply': '(%s*%s)',
+  'Divide': '_Divide(%s,%s)',
+  'Negate': '(-%s)',
+}
+
+_COLUMN_OPERATIONS = {
+  'Add': operator.add,
+  'Subtract': operator.sub,
+  'Multiply': operator.mul,
+  'Divide': operator.truediv,
+  'Negate': operator.neg,
+}
+
+
+class DeferredColumn(Column):
+  """A column computed from an expression of other columns on first use.
+
+  Deferred columns form an expression DAG. When one is first read, every
+  deferred operand used only by it is fused into the same evaluation, while
+  operands with several users are computed once and cached.
+
+  Attributes:
+    operation: The backend operation name, e.g. 'Add' or 'Negate'.
+    operands: The Columns the operation applies to, emptied once computed.
+    uses: The number of deferred columns and tables that read this column.
+  """
+
+  def __init__(self, operation, operands, name=None, description=None):
+    self.name = name
+    self.description = description
+    self.operation = operation
+    self.operands = tuple(operands)
+    self.uses = 0
+    self._value = None
+    for operand in self.operands:
+      if isinstance(operand, DeferredColumn):
+        operand.uses += 1
+
+  # The most operators fused into one pass, bounding each pass's nesting
+  MAX_FUSED_DEPTH = 32
+
+  @property
+  def value(self):
+    if self._value is None:
+      for column in self._Schedule():
+        leaves = column.Leaves()
+        column._value = _BackendOf(*(c.value for c in leaves)).Fused(column)
+        column.operands = ()  # release the operands, which are no longer read
+    return self._value
+
+  def _Schedule(self):
+    """Returns the deferred columns to compute for this one, operands first.
+
+    These are this column and every unevaluated deferred column it reads that
+    is not inlined: those with several users, those read through views, and
+    those where a chain of inlined operators reaches MAX_FUSED_DEPTH. Computing
+    them in order means no fused pass nests deeper than MAX_FUSED_DEPTH or
+    reads a leaf which is itself still deferred.
+    """
+    schedule = []
+    heights = {}  # id -> operators inlined below and including the column
+    forced = set()  # ids of columns read through views
+    visited = set()
+    pending = [(self, False)]
+    while pending:
+      column, reduced = pending.pop()
+      operands = []
+      for operand in column.operands:
+        if isinstance(operand, ColumnView):
+          operand = operand.source
+          forced.add(id(operand))
+        if isinstance(operand, DeferredColumn) and operand._value is None:
+          operands.append(operand)
+      if not reduced:
+        if id(column) not in visited:
+          visited.add(id(column))
+          pending.append((column, True))
+          pending.extend((operand, False) for operand in operands)
+        continue
+      height = 1 + max((heights[id(o)] for o in operands), default=0)
+      if (column is self or column.uses > 1 or id(column) in forced
+          or height >= self.MAX_FUSED_DEPTH):
+        schedule.append(column)
+        height = 0
+      heights[id(column)] = height
+    return schedule
+
+  def Inlines(self, column):
+    """Returns whether column is evaluated as part of this column's pass."""
+    return (column is self
+            or (isinstance(column, DeferredColumn)
+                and column._value is None and column.uses <= 1))
+
+  def Leaves(self):
+    """Returns the columns read by this column's fused evaluation."""
+    leaves = []
+    def Visit(c):
+      if self.Inlines(c):
+        for operand in c.operands:
+          Visit(operand)
+      else:
+        leaves.append(c)
+    Visit(self)
+    return leaves
+
+  def __repr__(self):
+    return 'DeferredColumn(%r, %r, name=%r, description=%r)' % (
+        self.operation, self.operands, self.name, self.description)
+
+
+def Defer(operation, *operands):
+  """Returns a DeferredColumn applying operation to operands.
+
+  Operations on scalars alone are folded immediately instead.
+  """
+  if all(isinstance(o, Scalar) for o in operands):
+    return _COLUMN_OPERATIONS[operation](*operands)
+  return DeferredColumn(operation, operands)
+
+
+class LazyColumn(Column):
+  """A column whose values are decoded the first time they are read.
+
+  Readers that can locate a column's cells without converting them return
+  lazy columns, so columns a program never reads cost no conversion. The
+  decoded buffer is cached, and the decode function released, on first use.
+
+  Attributes:
+    decode: A function returning the column's values, or None once decoded.
+  """
+
+  def __init__(self, decode, length, name=None, description=None):
+    self.name = name
+    self.description = description
+    self.decode = decode
+    self._length = length
+    self._value = None
+
+  @property
+  def value(self):
+    if self._value is None:
+      values = self.decode()
+      self._value = _BackendOf(values).Buffer(values)
+      self.decode = None
+    return self._value
+
+  def ToBackend(self, backend):
+    if self._value is not None:
+      return Column.ToBackend(self, backend)
+    return LazyColumn(lambda: backend.Buffer(self.value), self._length,
+                      name=self.name, description=self.description)
+
+  def IsDecoded(self):
+    """Returns whether the values have been decoded yet."""
+    return self._value is not None
+
+  def __len__(self):
+    return self._length
+
+  def __repr__(self):
+    if self._value is None:
+      return 'LazyColumn(<%d rows>, name=%r, description=%r)' % (
+          self._length, self.name, self.description)
+    return 'LazyColumn(%r, name=%r, description=%r)' % (
+        self._value, self.name, self.description)
+
+class ColumnView(Column):
+  """A column sharing another column's values under its own name and description.
+
+  Views make aliases O(1) in memory, and renaming or describing a view leaves
+  the source column untouched.
+  """
+
+  def __init__(self, source, name=None, description=None):
+    if isinstance(source, ColumnView):
+      source = source.source
+    self.source = source
+    self.name = name
+    self.description = description
+    if isinstance(source, DeferredColumn):
+      source.uses += 1
+
+  @property
+  def value(self):
+    return self.source.value
+
+  def __repr__(self):
+    return 'ColumnView(%r, name=%r, description=%r)' % (self.source, self.name, self.description)
+
+
 class Table(object):
+  """A collection of equal length columns, output as csv.
+
+  Rows are selected by lower_bound <= index <= upper_bound, where the index
+  is index_column. When the index is sorted the bounds are resolved to a
+  contiguous range of rows by binary search, so only rows in range are read.
+  """
 
   def __init__(self, columns,
                lower_bound=None, upper_bound=None, index_column=None,
@@ -56,22 +516,100 @@ class Table(object):
     else:
       raise ValueError("Table has no columns")
     self.description = description
+    self._sorted_index = None  # (index column, whether it is sorted)
+
+  def IsIndexSorted(self):
+    """Returns whether the index column is in ascending order.
+
+    The result is cached for as long as index_column refers to the same column.
+    """
+    if self._sorted_index is None or self._sorted_index[0] is not self.index_column:
+      index = self.index_column.value
+      self._sorted_index = (self.index_column, _BackendOf(index).IsSorted(index))
+    return self._sorted_index[1]
+
+  def RowRange(self):
+    """Returns the [start, stop) rows within the bounds, or None if unsorted."""
+    if not self.IsIndexSorted():
+      return None
+    index = self.index_column.value
+    return _BackendOf(index).Range(index, self.lower_bound, self.upper_bound)
+
+  def Rows(self):
+    """Yields the rows within the bounds as tuples of column values."""
+    row_range = self.RowRange()
+    if row_range is not None:
+      yield from zip(*(_BackendOf(c.value).Window(c.value, *row_range)
+                       for c in self.columns))
+      return
+    for index, row in zip(self.index_column.value,
+                          zip(*(c.value for c in self.columns))):
+      if ((self.lower_bound is None or index >= self.lower_bound)
+          and (self.upper_bound is None or index <= self.upper_bound)):
+        yield row
     
-  def __str__(self):
-    f = io.StringIO()
+  def Write(self, output_file, chunk_rows=4096):
+    """Writes the table as csv to a file-like object.
+
+    Rows are formatted into an in-memory buffer of at most chunk_rows rows
+    which is flushed to output_file, so memory use is bounded by the chunk
+    size rather than the table size.
+    """
+    buffer = io.StringIO()
     if self.description:
-      print(self.description, file=f)
+      print(self.description, file=buffer)
 
-    w = csv.writer(f)
+    w = csv.writer(buffer)
     w.writerow([c.name for c in self.columns])
+    rows = self.Rows()
+    while True:
+      w.writerows(itertools.islice(rows, chunk_rows))
+      if not buffer.tell():
+        break
+      output_file.write(buffer.getvalue())
+      buffer.seek(0)
+      buffer.truncate()
 
-    for index, row in zip(self.index_column, zip(*self.columns)):
-      if ((self.lower_bound is None or index >= self.lower_bound)
-          and (self.upper_bound is None or index <= self.upper_bound)):
-        w.writerow(row)
+  def __str__(self):
+    f = io.StringIO()
+    self.Write(f)
     return f.getvalue()
     
   def __eq__(self, other):
     return ((self.columns, self.index_column, self.description, self.lower_bound, self.upper_bound) ==
             (other.columns, other.index_column, other.description, other.lower_bound, other.upper_bound))
             
+
+
+def LiveBytes(values):
+  """Returns the bytes of column storage reachable from columns and tables.
+
+  Storage shared by several columns, such as a column and its views, is
+  counted once. Deferred and lazy columns only count once their values have
+  been computed, along with any operands they keep alive.
+  """
+  seen = set()
+  buffers = {}
+  pending = list(values)
+  while pending:
+    value = pending.pop()
+    if id(value) in seen:
+      continue
+    seen.add(id(value))
+    if isinstance(value, Table):
+      pending.extend(value.columns)
+      pending.append(value.index_column)
+    elif isinstance(value, ColumnView):
+      pending.append(value.source)
+    elif isinstance(value, Scalar):
+      continue
+    elif isinstance(value, DeferredColumn):
+      pending.extend(value.operands)
+      if value._value is not None:
+        buffers[id(value._value)] = value._value
+    elif isinstance(value, LazyColumn):
+      if value._value is not None:
+        buffers[id(value._value)] = value._value
+    elif isinstance(value, Column):
+      buffers[id(value.value)] = value.value
+  return sum(memoryview(b).nbytes for b in buffers.values())
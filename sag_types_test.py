@@ -0,0 +1,224 @@
+import unittest
+from array import array
+import math
+import sag_types
+from sag_types import Table, Column, Scalar, DeferredColumn, Defer, ColumnView, LazyColumn
+
+class ColumnTest(unittest.TestCase):
+
+  def testStoresArray(self):
+    column = Column([1, 2.5], name='Foo')
+    self.assertIsInstance(column.value, array)
+    self.assertEqual(column.value.typecode, 'd')
+    self.assertEqual(list(column), [1.0, 2.5])
+    self.assertEqual(column[1], 2.5)
+
+  def testArrayNotCopied(self):
+    values = array('d', [1.0, 2.0])
+    self.assertIs(Column(values).value, values)
+
+  def testArithmetic(self):
+    a = Column([1.0, 2.0, 3.0])
+    b = Column([2.0, 0.0, 4.0])
+    self.assertEqual(list(a + b), [3.0, 2.0, 7.0])
+    self.assertEqual(list(a - b), [-1.0, 2.0, -1.0])
+    self.assertEqual(list(a * b), [2.0, 0.0, 12.0])
+    self.assertEqual(list(-a), [-1.0, -2.0, -3.0])
+
+  def testDivideByZeroIsNan(self):
+    quotient = list(Column([1.0, 2.0]) / Column([2.0, 0.0]))
+    self.assertEqual(quotient[0], 0.5)
+    self.assertTrue(math.isnan(quotient[1]))
+
+
+class ColumnViewTest(unittest.TestCase):
+
+  def testSharesValuesNotMetadata(self):
+    source = Column([1.0, 2.0], name='Foo', description='foo')
+    view = source.View('bar')
+    view.description = 'bar'
+    self.assertIsInstance(view, ColumnView)
+    self.assertIs(view.value, source.value)
+    self.assertEqual((source.name, source.description), ('Foo', 'foo'))
+    self.assertEqual(list(view + source), [2.0, 4.0])
+
+  def testViewOfViewSharesSource(self):
+    source = Column([1.0])
+    self.assertIs(source.View('a').View('b').source, source)
+
+
+class ScalarTest(unittest.TestCase):
+
+  def testBroadcastsInOperators(self):
+    a = Column([1.0, 2.0, 4.0])
+    self.assertEqual(list(Scalar(1) - a), [0.0, -1.0, -3.0])
+    self.assertEqual(list(a * Scalar(2)), [2.0, 4.0, 8.0])
+    self.assertEqual(list(Scalar(8) / a), [8.0, 4.0, 2.0])
+
+  def testDivideByZeroScalarIsNan(self):
+    quotient = Column([1.0, 2.0]) / Scalar(0)
+    self.assertTrue(all(math.isnan(q) for q in quotient))
+
+  def testLiteralsFold(self):
+    folded = -(Scalar(1) + Scalar(2) * Scalar(3))
+    self.assertIsInstance(folded, Scalar)
+    self.assertEqual(folded.value, -7.0)
+
+  def testBroadcast(self):
+    self.assertEqual(list(Scalar(2).Broadcast(3)), [2.0, 2.0, 2.0])
+
+
+class DeferredColumnTest(unittest.TestCase):
+
+  def testFusedChain(self):
+    a = Column([1.0, 2.0])
+    b = Column([3.0, 4.0])
+    c = Column([5.0, 0.0])
+    result = Defer('Divide', Defer('Add', Defer('Multiply', a, b), Scalar(1)), c)
+    self.assertIsInstance(result, DeferredColumn)
+    self.assertEqual(result.Leaves(), [a, b, Scalar(1), c])
+    self.assertEqual(result[0], 0.8)
+    self.assertTrue(math.isnan(result[1]))
+
+  def testSharedOperandComputedOnce(self):
+    a = Column([1.0, 2.0])
+    shared = Defer('Negate', a)
+    first = Defer('Add', shared, a)
+    second = Defer('Multiply', shared, a)
+    self.assertEqual(first.Leaves(), [shared, a])
+    self.assertEqual(list(first), [0.0, 0.0])
+    self.assertEqual(list(second), [-1.0, -4.0])
+    self.assertIsNotNone(shared._value)
+
+  def testNotEvaluatedUntilRead(self):
+    result = Defer('Add', Column([1.0]), Column([2.0]))
+    self.assertIsNone(result._value)
+    self.assertEqual(list(result), [3.0])
+
+  def testLongChainFusedInBoundedPasses(self):
+    foo = Column([1.0, 2.0])
+    column = foo
+    for _ in range(1000):
+      column = Defer('Add', column, foo)
+    self.assertEqual(list(column), [1001.0, 2002.0])
+
+  def testScalarsFold(self):
+    self.assertEqual(Defer('Subtract', Scalar(1), Scalar(3)), Scalar(-2))
+
+
+class LazyColumnTest(unittest.TestCase):
+
+  def testDecodedOnceOnFirstRead(self):
+    calls = []
+    def Decode():
+      calls.append(None)
+      return array('d', [1.0, 2.0])
+    column = LazyColumn(Decode, 2, name='a')
+    self.assertEqual(len(column), 2)
+    self.assertEqual(calls, [])
+    self.assertEqual(list(column + column), [2.0, 4.0])
+    self.assertEqual(list(column), [1.0, 2.0])
+    self.assertEqual(len(calls), 1)
+
+
+class LiveBytesTest(unittest.TestCase):
+
+  def testCountsSharedStorageOnce(self):
+    column = Column(array('d', [1.0, 2.0]))
+    lazy = LazyColumn(lambda: array('d', [3.0]), 1)
+    deferred = Defer('Add', column, Scalar(1))
+    values = [column, column.View('alias'), Table([column]), lazy, deferred]
+    self.assertEqual(sag_types.LiveBytes(values), 16)
+    list(lazy)
+    list(deferred)
+    self.assertEqual(sag_types.LiveBytes(values), 40)
+
+
+@unittest.skipUnless(sag_types.numpy, 'numpy is not installed')
+class NumpyBackendTest(unittest.TestCase):
+
+  def setUp(self):
+    self.backend = sag_types.GetBackend('numpy')
+
+  def testDefaultsToNumpy(self):
+    self.assertIs(sag_types.GetBackend(), self.backend)
+
+  def testArithmetic(self):
+    a = Column([1.0, 2.0, 3.0]).ToBackend(self.backend)
+    b = Column([2.0, 0.0, 4.0]).ToBackend(self.backend)
+    self.assertIs((a + b).backend, self.backend)
+    self.assertEqual(list(a + b), [3.0, 2.0, 7.0])
+    self.assertEqual(list(a - b), [-1.0, 2.0, -1.0])
+    self.assertEqual(list(a * b), [2.0, 0.0, 12.0])
+    self.assertEqual(list(-a), [-1.0, -2.0, -3.0])
+
+  def testDivideByZeroIsNan(self):
+    a = Column([1.0, 2.0], backend=self.backend)
+    b = Column([2.0, 0.0], backend=self.backend)
+    quotient = list(a / b)
+    self.assertEqual(quotient[0], 0.5)
+    self.assertTrue(math.isnan(quotient[1]))
+
+  def testScalarBroadcast(self):
+    a = Column([1.0, 2.0], backend=self.backend)
+    self.assertEqual(list(Scalar(1) - a), [0.0, -1.0])
+    self.assertTrue(all(math.isnan(q) for q in a / Scalar(0)))
+
+  def testDeferred(self):
+    a = Column([1.0, 2.0], backend=self.backend)
+    result = Defer('Divide', Defer('Subtract', Scalar(1), a), a)
+    self.assertEqual(list(result), [0.0, -0.5])
+    self.assertIs(result.backend, self.backend)
+
+  def testTableRange(self):
+    table = Table([Column([1.0, 2.0, 3.0], name='Age', backend=self.backend)],
+                  lower_bound=2)
+    self.assertEqual(table.RowRange(), (1, 3))
+    self.assertEqual(str(table), 'Age\r\n2.0\r\n3.0\r\n')
+
+  def testEqualAcrossBackends(self):
+    a = Column([1.0, 2.0], name='Foo')
+    self.assertEqual(a.ToBackend(self.backend), a)
+
+
+class TableTest(unittest.TestCase):
+
+  def testStr(self):
+    table = Table([Column([1.0, 2.0, 3.0], name='Age'),
+                   Column([0.5, 0.25, 0.125], name='Foo')],
+                  lower_bound=2, description='Desc')
+    self.assertEqual(str(table), 'Desc\nAge,Foo\r\n2.0,0.25\r\n3.0,0.125\r\n')
+
+  def testWriteInChunks(self):
+    writes = []
+    class Recorder(object):
+      def write(self, s):
+        writes.append(s)
+    table = Table([Column([1.0, 2.0, 3.0], name='Age')], description='Desc')
+    table.Write(Recorder(), chunk_rows=2)
+    self.assertEqual(writes, ['Desc\nAge\r\n1.0\r\n2.0\r\n', '3.0\r\n'])
+    self.assertEqual(''.join(writes), str(table))
+
+  def testSortedIndexRange(self):
+    table = Table([Column([60.0, 61.0, 62.0, 63.0], name='Age'),
+                   Column([1.0, 2.0, 3.0, 4.0], name='Foo')],
+                  lower_bound=60.5, upper_bound=62)
+    self.assertTrue(table.IsIndexSorted())
+    self.assertEqual(table.RowRange(), (1, 3))
+    self.assertEqual(list(table.Rows()), [(61.0, 2.0), (62.0, 3.0)])
+
+  def testUnsortedIndexScans(self):
+    table = Table([Column([3.0, 1.0, 2.0], name='Age')], upper_bound=2)
+    self.assertFalse(table.IsIndexSorted())
+    self.assertIsNone(table.RowRange())
+    self.assertEqual(list(table.Rows()), [(1.0,), (2.0,)])
+
+  def testSortednessCachedPerIndexColumn(self):
+    table = Table([Column([1.0, 2.0], name='Age'), Column([2.0, 1.0], name='Foo')])
+    self.assertTrue(table.IsIndexSorted())
+    table.index_column = table.columns[1]
+    self.assertFalse(table.IsIndexSorted())
+
+
+if __name__ == '__main__':
+  unittest.main()
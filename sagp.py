@@ -1,26 +1,103 @@
 import argparse
+import functools
+import glob
+import os
+import sys
 
-from sag_parser import Evaluate
-from table_parser import ParseCSVTable, ParseRuthenTable
+from sag_parser import Compile, Evaluate, EvaluateBatch
+from sag_types import BACKENDS
+from table_parser import LoadTable, RuthenFile, TableCache
+from table_snapshot import WriteTableSnapshot
 
 if __name__ == '__main__':
   parser = argparse.ArgumentParser(description='Evaluate a SAGL script on a RUTHEN table')
   parser.add_argument('program', type=argparse.FileType('r'),
                     help='The SAGL program to evaluate')
-  parser.add_argument('input_table', type=argparse.FileType('r'),
-                    help='The RUTHEN table to use as input')
+  parser.add_argument('input_table', nargs='+',
+                    help='The RUTHEN table, csv table or table snapshot to use as '
+                         'input. Tables may be gzip, bz2 or xz compressed. Given '
+                         'several tables or glob patterns, the program is '
+                         'evaluated on each')
   parser.add_argument('--output', type=argparse.FileType('w'),
                     default=None,
                     help='The file path to output to')
   parser.add_argument('--csv', type=bool,
                     default=False,
                     help='The file path to output to')
+  parser.add_argument('--backend', choices=sorted(BACKENDS),
+                    default=None,
+                    help='The column arithmetic backend, numpy if installed by default')
+  parser.add_argument('--deferred', action='store_true',
+                    help='Only evaluate columns when an output table needs them')
+  parser.add_argument('--prune', action='store_true',
+                    help='Skip, and report, statements whose columns never reach an OUTPUT')
+  parser.add_argument('--report_memory', action='store_true',
+                    help='Report the peak memory held by live columns of a single input table')
+  parser.add_argument('--write_snapshot', default=None,
+                    help='A file path to save the parsed input table to as a snapshot')
+  parser.add_argument('--table', default=None,
+                    help='The index or title of the table to import from a multi-table RUTHEN file')
+  parser.add_argument('--workers', type=int, default=1,
+                    help='The number of processes to parse a RUTHEN table with')
+  parser.add_argument('--cache', action='store_true',
+                    help='Reuse parsed input tables cached on disk by earlier runs')
+  parser.add_argument('--cache_dir',
+                    default=os.path.join(os.path.expanduser('~'), '.cache', 'sagp'),
+                    help='The directory to cache parsed tables in')
+  parser.add_argument('--cache_size_mb', type=int, default=1024,
+                    help='The size the cache is trimmed to, evicting least recently used tables')
+  parser.add_argument('--clear_cache', action='store_true',
+                    help='Remove all cached tables before running')
+  parser.add_argument('--jobs', type=int, default=None,
+                    help='The number of processes to evaluate several input tables '
+                         'with, one per CPU by default')
+  parser.add_argument('--output_dir', default=None,
+                    help='A directory to write each input table\'s output to, '
+                         'instead of writing all outputs to --output in input order')
                     
   args = parser.parse_args()
-  sagl = args.program.read()
-  if args.csv:
-    table = ParseCSVTable(args.input_table.read())
-  else:
-    table = ParseRuthenTable(args.input_table.read())
+  # Prune before sharing subexpressions, so only the program's own
+  # statements are reported
+  sagl = Compile(args.program.read(), share_subexpressions=False)
+  if args.prune:
+    sagl, skipped = sagl.EliminateDeadColumns()
+    for statement in skipped:
+      print("Skipped %s %s on line %d, it never reaches an OUTPUT"
+            % (type(statement).__name__.upper(), statement.name, statement.lineno),
+            file=sys.stderr)
+  sagl, _ = sagl.EliminateCommonSubexpressions()
+  inputs = [path for pattern in args.input_table
+            for path in (sorted(glob.glob(pattern)) or [pattern])]
+  cache = None
+  if args.cache or args.clear_cache:
+    cache = TableCache(args.cache_dir, max_bytes=args.cache_size_mb << 20)
+    if args.clear_cache:
+      cache.Clear()
+    if not args.cache:
+      cache = None
+  table = None
+  if args.table is not None or sagl.ImportedTables():
+    table = args.table or 0
+
+  if len(inputs) > 1 or args.output_dir is not None:
+    if args.write_snapshot:
+      parser.error('--write_snapshot takes a single input table')
+    load = functools.partial(LoadTable, csv=args.csv, table=table, cache=cache)
+    EvaluateBatch(sagl, inputs, output_file=args.output,
+                  output_dir=args.output_dir, workers=args.jobs, load=load,
+                  backend=args.backend, deferred=args.deferred)
+    parser.exit()
+
+  # Snapshots keep every column, so only project when not writing one
+  columns = None if args.write_snapshot else sagl.RequiredColumns()
+  table = LoadTable(inputs[0], columns=columns, csv=args.csv, table=table,
+                    cache=cache, workers=args.workers)
+  if args.write_snapshot:
+    WriteTableSnapshot(table.Table() if isinstance(table, RuthenFile) else table,
+                       args.write_snapshot)
 
-  Evaluate(sagl, input_table=table, output_file=args.output)
+  peak_bytes = Evaluate(sagl, input_table=table, output_file=args.output,
+                        backend=args.backend, deferred=args.deferred,
+                        measure_memory=args.report_memory)
+  if args.report_memory:
+    print("Peak live column memory: {:,} bytes".format(peak_bytes), file=sys.stderr)
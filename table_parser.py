@@ -1,77 +1,659 @@
+import bz2
+import concurrent.futures
 import csv
+import gzip
+import hashlib
 import io
-from sag_types import Table, Column
+import itertools
+import lzma
+import mmap
+import operator
+import os
+import re
+import tempfile
+from array import array
+from sag_types import Table, Column, LazyColumn
+from table_snapshot import IsTableSnapshot, LoadTableSnapshot, WriteTableSnapshot
 
+# Changing how tables are parsed must bump this, invalidating cached tables
+PARSER_VERSION = 1
 
-def ParseCSVTable(table_str):
+
+class TableCache(object):
+  """An on-disk cache of parsed tables.
+
+  Tables are stored as snapshots named by a hash of the parser input and
+  PARSER_VERSION, so hits are loaded by memory-mapping without any parsing.
+  When the cache grows past max_bytes the least recently used entries are
+  evicted, using file modification times to track use.
+  """
+
+  SUFFIX = '.sagt'
+
+  def __init__(self, directory, max_bytes=1 << 30):
+    self.directory = directory
+    self.max_bytes = max_bytes
+    os.makedirs(directory, exist_ok=True)
+
+  def Key(self, *parts):
+    """Returns the cache key for a sequence of str, bytes or other parts."""
+    digest = hashlib.sha256(b'%d' % PARSER_VERSION)
+    for part in parts:
+      if isinstance(part, str):
+        part = part.encode('utf-8')
+      elif not isinstance(part, (bytes, bytearray, memoryview, mmap.mmap)):
+        part = repr(part).encode('utf-8')
+      digest.update(b'%d:' % memoryview(part).nbytes)
+      digest.update(part)
+    return digest.hexdigest()
+
+  def _Path(self, key):
+    return os.path.join(self.directory, key + self.SUFFIX)
+
+  def Get(self, key):
+    """Returns the cached table for key, or None."""
+    path = self._Path(key)
+    try:
+      table = LoadTableSnapshot(path)
+    except (OSError, ValueError):
+      return None
+    os.utime(path)  # mark as recently used
+    return table
+
+  def Put(self, key, table):
+    """Stores a table under key, then evicts entries over the size limit."""
+    fd, temporary = tempfile.mkstemp(suffix='.tmp', dir=self.directory)
+    os.close(fd)
+    try:
+      WriteTableSnapshot(table, temporary)
+      os.replace(temporary, self._Path(key))
+    except BaseException:
+      os.remove(temporary)
+      raise
+    self.Evict(keep=key)
+
+  def Lookup(self, parts, parse):
+    """Returns the table cached for parts, calling parse() on a miss."""
+    key = self.Key(*parts)
+    table = self.Get(key)
+    if table is None:
+      table = parse()
+      self.Put(key, table)
+    return table
+
+  def _Entries(self):
+    return [e for e in os.scandir(self.directory)
+            if e.name.endswith(self.SUFFIX) and e.is_file()]
+
+  def Evict(self, keep=None):
+    """Removes least recently used entries until under max_bytes."""
+    entries = []
+    for entry in self._Entries():
+      try:
+        entries.append((entry.stat(), entry))
+      except FileNotFoundError:
+        continue  # evicted by another process sharing the cache
+    entries.sort(key=lambda e: e[0].st_mtime_ns)
+    total = sum(stat.st_size for stat, _ in entries)
+    kept = None if keep is None else keep + self.SUFFIX
+    for stat, entry in entries:
+      if total <= self.max_bytes:
+        break
+      if entry.name == kept:
+        continue
+      total -= stat.st_size
+      try:
+        os.remove(entry.path)
+      except FileNotFoundError:
+        pass
+
+  def Clear(self):
+    """Removes every cached table."""
+    for entry in self._Entries():
+      os.remove(entry.path)
+
+
+# Compressed file openers, by the magic bytes which start their files
+_DECOMPRESSORS = (
+  (b'\x1f\x8b', gzip.open),
+  (b'BZh', bz2.open),
+  (b'\xfd7zXZ\x00', lzma.open),
+)
+
+def _Decompressor(path):
+  """Returns the opener for a compressed file, or None if it isn't compressed."""
+  with open(path, 'rb') as f:
+    magic = f.read(6)
+  for prefix, opener in _DECOMPRESSORS:
+    if magic.startswith(prefix):
+      return opener
+  return None
+
+def OpenTableFile(path, mode='rb', newline=None):
+  """Opens a table file, decompressing gzip, bz2 and xz files as a stream.
+
+  Compression is detected from the file's magic bytes rather than its name.
+
+  Args:
+    path: The path of the file
+    mode: 'rb' to read bytes or 'rt' to read text
+    newline: Newline handling for text mode, as for open()
+  """
+  opener = _Decompressor(path)
+  if opener is None:
+    return open(path, mode, newline=newline)
+  if 't' in mode:
+    return opener(path, mode, newline=newline)
+  return opener(path, mode)
+
+def _ColumnsKey(columns):
+  return None if columns is None else sorted(c.lower() for c in columns)
+
+def _FileIdentity(source):
+  """Returns (path, size, mtime) for a path or real file, otherwise None."""
+  if isinstance(source, (str, os.PathLike)):
+    path, status = source, os.stat(source)
+  else:
+    try:
+      path, status = source.name, os.fstat(source.fileno())
+    except (AttributeError, OSError, io.UnsupportedOperation):
+      return None
+  return (os.path.abspath(path), status.st_size, status.st_mtime_ns)
+
+
+
+def Project(names, columns=None):
+  """Returns the positions of the names to keep, in their original order.
+
+  Args:
+    names: The column names in a table header
+    columns: The column names to keep, compared case insensitively, or None to
+      keep every column
+  """
+  if columns is None:
+    return list(range(len(names)))
+  columns = set(c.lower() for c in columns)
+  return [i for i, name in enumerate(names) if name.strip().lower() in columns]
+
+def _Getter(keys):
+  """Returns a function mapping a sequence to a tuple of its items at keys."""
+  if not keys:
+    return lambda row: ()
+  getter = operator.itemgetter(*keys)
+  if len(keys) == 1:
+    return lambda row: (getter(row),)
+  return getter
+
+def ParseCSVTable(table_str, columns=None, cache=None):
   """Parses a csv table to a SAG Table.
   
-  This is temporary while the RUTHEN table parser is written."""
-  r = csv.reader(io.StringIO(table_str))
-  return Table([Column([float(e.replace(',', '')) for e in col[1:]], name = col[0], description='from csv')
-                for col in zip(*r)])
+  This is temporary while the RUTHEN table parser is written.
+
+  Args:
+    table_str: The csv text, with column names in the first row
+    columns: If given, only the columns with these names are converted
+    cache: An optional TableCache, keyed by the text, to check first
+  """
+  if cache is not None:
+    return cache.Lookup(('csv', _ColumnsKey(columns), table_str),
+                        lambda: ParseCSVTable(table_str, columns=columns))
+  with io.StringIO(table_str) as f:
+    return ReadCSVTable(f, columns=columns)
+
+def ReadCSVTable(source, columns=None, max_rows=None, cache=None, chunk_rows=4096):
+  """Reads a csv table to a SAG Table, appending rows straight to columns.
+
+  Rows are read in chunks of chunk_rows and each chunk is decoded column by
+  column, so the table is never held as a whole in rows.
+
+  Args:
+    source: An open text file, any other iterable of lines, or a file path,
+      which is decompressed if it is a gzip, bz2 or xz file
+    columns: If given, only the columns with these names are converted
+    max_rows: If given, at most this many rows are read
+    cache: An optional TableCache to check first, keyed by the file's path,
+      size and modification time. Sources which aren't files are not cached.
+    chunk_rows: The number of rows to decode at once
+  """
+  identity = None if cache is None else _FileIdentity(source)
+  if identity is not None:
+    return cache.Lookup(('csv-file', _ColumnsKey(columns), max_rows) + identity,
+                        lambda: ReadCSVTable(source, columns=columns, max_rows=max_rows))
+  if isinstance(source, (str, os.PathLike)):
+    with OpenTableFile(source, 'rt', newline='') as f:
+      return ReadCSVTable(f, columns=columns, max_rows=max_rows)
+
+  r = csv.reader(source)
+  header = next(r, [])
+  cells = _Getter(Project(header, columns))
+  names = cells(header)
+  values = [array('d') for _ in names]
+  rows = map(cells, itertools.islice(r, max_rows))
+  while True:
+    chunk = list(itertools.islice(rows, chunk_rows))
+    if not chunk:
+      break
+    _AppendChunk(values, chunk)
+  return Table([Column(value, name=name, description='from csv')
+                for name, value in zip(names, values)])
+
+def _AppendChunk(values, rows):
+  """Decodes a chunk of rows of cells column by column onto values."""
+  for value, column in zip(values, zip(*rows)):
+    value.extend(DecodeNumbers(column))
   
+# A cell with its leading padding, so that consecutive matches tile the line
+_CELL = re.compile(r'\s*\S+')
+_CELL_BYTES = re.compile(rb'\s*\S+')
+
 def FindSeparations(line):
   """Finds the separations in a fixed width line.
   
   Columns are assumed to be right-aligned and space padded, with at least one
-  space between each column and no internal spaces.
+  space between each column and no internal spaces. The line, str or bytes, is
+  scanned in a single regular expression pass.
   
   Returns:
     A sequence of (begin, end) tuples, where begin is the first character index
     in a column and end is one past the last index so that line[begin:end] is
     the cell contents.
   """
-  separations = []
-  cell_begin=0
-  space_previous=True
-  for i in range(len(line)):
-    if line[i].isspace() and not space_previous:
-      separations.append((cell_begin, i))
-      cell_begin = i
-    space_previous = line[i].isspace()
-  else:
-    if not space_previous:
-      separations.append((cell_begin, len(line)))
-  return separations
+  cells = (_CELL if isinstance(line, str) else _CELL_BYTES).findall(line)
+  ends = list(itertools.accumulate(map(len, cells)))
+  return list(zip([0] + ends[:-1], ends))
   
 def Separate(line, separations):
   """Separates a line into its fixed-width cells and trims whitespace."""
   return [line[b:e].lstrip() for (b, e) in separations]
+
+def CompileSeparations(separations):
+  """Compiles separations into a function that splits a line in one call.
+
+  The returned function maps a line to a tuple of its untrimmed cells.
+  """
+  return _Getter([slice(b, e) for (b, e) in separations])
   
-def ParseRuthenTable(table_str):
-  """Parses a RUTHEN table to a SAG table."""
-  if table_str[:6] != "RUTHEN":
+def ParseRuthenTable(table_str, columns=None, cache=None, lazy=False):
+  """Parses a RUTHEN table to a SAG table.
+
+  Args:
+    table_str: The RUTHEN output, as text or as ASCII bytes
+    columns: If given, only the columns with these names are sliced and
+      converted
+    cache: An optional TableCache, keyed by the text, to check first. Cached
+      tables are always decoded in full.
+    lazy: If true, each column is converted only when its values are first
+      read. See ReadRuthenTable.
+  """
+  if cache is not None:
+    return cache.Lookup(('ruthen', _ColumnsKey(columns), table_str),
+                        lambda: ParseRuthenTable(table_str, columns=columns))
+  if isinstance(table_str, str):
+    lines = io.StringIO(table_str)
+  else:
+    lines = io.BytesIO(table_str)
+  with lines:
+    return ReadRuthenTable(lines, columns=columns, lazy=lazy)
+
+def ReadRuthenTable(source, columns=None, cache=None, workers=1, lazy=False):
+  """Reads a RUTHEN table to a SAG table, consuming one line at a time.
+
+  Cells are converted straight into column storage as lines are read, so the
+  text of the file is never held in memory as a whole.
+
+  Args:
+    source: A file path, an open text or binary file, an mmap, or any other
+      iterable of str or bytes lines. Files opened from a path are read as
+      bytes, decompressing them if they are gzip, bz2 or xz files.
+    columns: If given, only the columns with these names are sliced and
+      converted
+    cache: An optional TableCache to check first, keyed by the file's path,
+      size and modification time. Sources which aren't files are not cached.
+    workers: The number of processes to decode rows with. Values above 1 only
+      apply when source is an uncompressed file path or a file opened from one.
+    lazy: If true, the table's rows are kept as one raw buffer and each column
+      is a LazyColumn, sliced out of the buffer and converted the first time
+      its values are read. Lazy reads are never cached or parallel.
+  """
+  identity = None if cache is None else _FileIdentity(source)
+  if identity is not None and not lazy:
+    return cache.Lookup(('ruthen-file', _ColumnsKey(columns)) + identity,
+                        lambda: ReadRuthenTable(source, columns=columns,
+                                                workers=workers))
+  if workers > 1 and not lazy:
+    identity = _FileIdentity(source)
+    if identity is not None and _Decompressor(identity[0]) is None:
+      return _ReadRuthenTableParallel(identity[0], columns, workers)
+  if isinstance(source, (str, os.PathLike)):
+    with OpenTableFile(source) as f:
+      return ReadRuthenTable(f, columns=columns, lazy=lazy)
+
+  if isinstance(source, mmap.mmap):
+    lines = iter(source.readline, b'')
+  else:
+    lines = iter(source)
+  _SkipRuthenHeader(lines)
+  description = _ReadDescription(lines)
+
+  names = []
+  values = []
+  header = next(lines, None)
+  if header is not None:
+    names, separations = _ReadHeader(header, columns)
+    if lazy:
+      return Table(_LazyColumns(lines, names, separations, len(header)),
+                   description=description)
+    values = [array('d') for _ in names]
+    _DecodeRows(lines, CompileSeparations(separations), len(header), values)
+    # TODO parse the column descriptions
+
+  return _RuthenTable(names, values, description)
+
+def _SkipRuthenHeader(lines):
+  """Checks and skips the header at the start of a RUTHEN file.
+
+  Args:
+    lines: An iterator of str or bytes lines, such as a binary file
+  """
+  if _Text(next(lines, ''))[:6] != "RUTHEN":
     raise ValueError("Table doesn't have a RUTHEN header")
+  for _ in range(3):
+    next(lines, None)  # Skip the header
+
+def _ReadDescription(lines, required=True):
+  """Reads a table's description, up to and including its BEGIN TABLE line.
 
+  Args:
+    lines: An iterator of str or bytes lines, such as a binary file
+    required: Whether running out of lines first is an error
+
+  Returns:
+    The description text, or None if the lines ran out and not required.
+  """
   description_lines = []
-  table_rows = []
-  table_begun=False
-  separations = None
-  table_width = None
-  with io.StringIO(table_str) as lines:
-    for line_num, line in enumerate(lines):
-      if line_num < 4:
-        continue  # Skip the header
-      if line.startswith('BEGIN TABLE'):
-        table_begun=True
-        continue
-        
-      if table_begun:
-        if not separations:  # are we reading the table headers
-          separations = FindSeparations(line)
-          table_width = len(line)
-        if len(line) != table_width:
-          break  # Done parsing the table
-          # TODO parse the column descriptions
-        table_rows.append(Separate(line, separations))
-      else:
-        description_lines.append(line)
-        
-  if not table_begun:
+  for line in lines:
+    if _Text(line).startswith('BEGIN TABLE'):
+      return ''.join(description_lines)
+    description_lines.append(_Text(line))
+  if required:
     raise ValueError("No BEGIN TABLE line found")
+  return None
+
+def _RuthenTable(names, values, description):
+  """Returns a table of the named column arrays decoded from a RUTHEN file."""
+  return Table([Column(value, name=name, description='from RUTHEN')
+                for name, value in zip(names, values)],
+                description=description)
+
+def _LazyColumns(lines, names, separations, table_width):
+  """Returns LazyColumns decoding the fixed-width rows at the head of lines.
+
+  The rows are joined into a single buffer, in which the cells of a column
+  lie at the same offsets from every multiple of table_width.
+  """
+  rows = list(itertools.takewhile(lambda line: len(line) == table_width, lines))
+  body = rows[0][:0].join(rows) if rows else b''
+  del rows
+
+  def Decoder(begin, end):
+    return lambda: DecodeNumbers([body[row + begin:row + end]
+                                  for row in range(0, len(body), table_width)])
+
+  return [LazyColumn(Decoder(begin, end), len(body) // table_width,
+                     name=name, description='from RUTHEN')
+          for name, (begin, end) in zip(names, separations)]
+
+def _ReadHeader(header, columns=None):
+  """Returns the projected column names and separations of a table header."""
+  header = _Text(header)
+  separations = FindSeparations(header)
+  names = [cell.strip() for cell in Separate(header, separations)]
+  selected = Project(names, columns)
+  return [names[i] for i in selected], [separations[i] for i in selected]
+
+def _Text(line):
+  """Returns a header line as str, decoding bytes with universal newlines."""
+  if isinstance(line, str):
+    return line
+  return line.decode('latin-1').replace('\r\n', '\n')
+
+def DecodeNumbers(cells):
+  """Converts a column of numeric cells to a float64 array.
+
+  The whole column is converted in one map(float) pass, without copying any
+  cell. Only if that fails, because some cell holds thousands separators, is
+  the column converted again with the separators stripped.
+
+  Args:
+    cells: A sequence of str or bytes cells, which may be space padded
+  """
+  try:
+    return array('d', map(float, cells))
+  except ValueError:
+    if not cells:
+      raise
+    comma = ',' if isinstance(cells[0], str) else b','
+    empty = comma[:0]
+    return array('d', [float(cell.replace(comma, empty)) for cell in cells])
+
+def _DecodeRows(lines, cells, table_width, values, chunk_rows=4096):
+  """Appends fixed-width rows to values until a line of a different width.
+
+  Lines may be str or bytes. float() accepts bytes directly, so binary rows
+  are sliced and converted without ever being decoded to str. Rows are split
+  in chunks of chunk_rows, and each column of a chunk is decoded in a batch.
+
+  Args:
+    lines: An iterator of the table's rows
+    cells: A function splitting a row into one cell per column of values
+    table_width: The length of every row in the table
+    values: The column arrays to append to
+    chunk_rows: The number of rows to decode at once
+
+  Returns:
+    Whether a line ending the table was found.
+  """
+  chunk = []
+  for line in lines:
+    if len(line) != table_width:
+      _AppendChunk(values, map(cells, chunk))
+      return True  # Done parsing the table
+    chunk.append(line)
+    if len(chunk) == chunk_rows:
+      _AppendChunk(values, map(cells, chunk))
+      chunk = []
+  _AppendChunk(values, map(cells, chunk))
+  return False
+
+def _DecodeChunk(path, start, stop, separations, table_width):
+  """Decodes the table rows in bytes [start, stop) of a RUTHEN file.
+
+  Returns:
+    A tuple of the decoded column arrays and whether the end of the table was
+    found within the chunk.
+  """
+  values = [array('d') for _ in separations]
+  with open(path, 'rb') as f:
+    f.seek(start)
+    lines = f.read(stop - start).splitlines(keepends=True)
+  ended = _DecodeRows(iter(lines), CompileSeparations(separations), table_width, values)
+  return values, ended
+
+def _ReadRuthenTableParallel(path, columns, workers, min_chunk_bytes=1 << 16):
+  """Reads a RUTHEN table file, decoding line aligned chunks in processes.
+
+  The header is read up to the table's column header line, which fixes the
+  separations. The rest of the file is split into byte ranges beginning at
+  line starts, and the decoded chunks are concatenated in file order up to
+  the first line whose width shows the table has ended.
+  """
+  with open(path, 'rb') as f:
+    _SkipRuthenHeader(f)
+    description = _ReadDescription(f)
+    header = f.readline()
+    body_start = f.tell()
+    body_stop = os.fstat(f.fileno()).st_size
+
+    names, separations = _ReadHeader(header, columns)
 
-  return Table([Column([float(e.replace(',', '')) for e in col[1:]],
-                        name = col[0], description='from RUTHEN')
-                for col in zip(*table_rows)],
-                description=''.join(description_lines))
+    chunk_bytes = max(min_chunk_bytes, (body_stop - body_start) // (workers * 4) + 1)
+    boundaries = [body_start]
+    while boundaries[-1] + chunk_bytes < body_stop:
+      f.seek(boundaries[-1] + chunk_bytes)
+      f.readline()  # align to the start of the next line
+      boundaries.append(f.tell())
+    boundaries.append(body_stop)
+
+  values = [array('d') for _ in names]
+  with concurrent.futures.ProcessPoolExecutor(max_workers=workers) as executor:
+    chunks = [executor.submit(_DecodeChunk, path, start, stop, separations, len(header))
+              for start, stop in zip(boundaries, boundaries[1:]) if start < stop]
+    for chunk in chunks:
+      chunk_values, ended = chunk.result()
+      for value, chunk_value in zip(values, chunk_values):
+        value.extend(chunk_value)
+      if ended:
+        break
+    for chunk in chunks:
+      chunk.cancel()
+
+  return _RuthenTable(names, values, description)
+
+
+class RuthenTableBlock(object):
+  """The location of one BEGIN TABLE block within a RUTHEN file.
+
+  Attributes:
+    index: The position of the block in the file, from 0
+    title: The paragraph immediately before the block's BEGIN TABLE line
+    description: All lines between the previous block, or the file header,
+      and the BEGIN TABLE line
+    names: The column names in the block's header
+    header: The block's column header line, as bytes
+    offset: The byte offset of the block's first row
+    rows: The number of rows in the block
+  """
+
+  def __init__(self, index, title, description, header, offset, rows):
+    self.index = index
+    self.title = title
+    self.description = description
+    self.header = header
+    self.names = [cell.strip() for cell in _Text(header).split()]
+    self.offset = offset
+    self.rows = rows
+
+  def __repr__(self):
+    return 'RuthenTableBlock(%d, %r, offset=%d, rows=%d)' % (
+        self.index, self.title, self.offset, self.rows)
+
+
+def ScanRuthenTables(path):
+  """Finds every table block in a RUTHEN file without converting any cells.
+
+  Returns:
+    A list of RuthenTableBlocks in file order.
+  """
+  blocks = []
+  with OpenTableFile(path) as f:
+    _SkipRuthenHeader(f)
+    line = b''  # The line which ended the previous block
+    while True:
+      lines = itertools.chain([line] if line else [], f)
+      description = _ReadDescription(lines, required=False)
+      if description is None:
+        break
+      header = f.readline()
+      offset = f.tell()
+      rows = 0
+      line = f.readline()
+      while line and len(line) == len(header):
+        rows += 1
+        line = f.readline()
+      paragraphs = description.strip().split('\n\n')
+      blocks.append(RuthenTableBlock(len(blocks), paragraphs[-1].strip(),
+                                     description, header, offset, rows))
+  return blocks
+
+
+class RuthenFile(object):
+  """A RUTHEN file holding several tables, each parsed only when requested.
+
+  Creating a RuthenFile scans the file for its table blocks. Tables are then
+  selected by index or by title and parsed on demand, converting only the
+  requested columns.
+  """
+
+  def __init__(self, path, default=0):
+    """Scans a RUTHEN file.
+
+    Args:
+      path: The path of the RUTHEN file
+      default: The index or title of the table returned when none is named
+    """
+    self.path = path
+    self.default = default
+    self.blocks = ScanRuthenTables(path)
+    if not self.blocks:
+      raise ValueError("No BEGIN TABLE line found")
+
+  def Block(self, key=None):
+    """Returns the RuthenTableBlock with an index or title matching key.
+
+    Args:
+      key: An index, a string of digits holding an index, or text which
+        appears in the block's title, compared case insensitively. Defaults
+        to the file's default table.
+    """
+    key = self.default if key is None else key
+    if isinstance(key, str) and key.isdigit():
+      key = int(key)
+    if isinstance(key, (int, float)):
+      if not 0 <= key < len(self.blocks) or key != int(key):
+        raise ValueError("No table %r, %s has %d tables" % (key, self.path, len(self.blocks)))
+      return self.blocks[int(key)]
+    for block in self.blocks:
+      if key.lower() in block.title.lower():
+        return block
+    raise ValueError("No table titled %r in %s" % (key, self.path))
+
+  def Table(self, key=None, columns=None):
+    """Parses one table from the file.
+
+    Args:
+      key: Selects the table, see Block
+      columns: If given, only the columns with these names are converted
+    """
+    block = self.Block(key)
+    names, separations = _ReadHeader(block.header, columns)
+    values = [array('d') for _ in names]
+    with OpenTableFile(self.path) as f:
+      f.seek(block.offset)
+      lines = itertools.islice(f, block.rows)
+      _DecodeRows(lines, CompileSeparations(separations), len(block.header), values)
+    return _RuthenTable(names, values, block.description)
+
+
+def LoadTable(path, columns=None, csv=False, table=None, cache=None, workers=1):
+  """Loads an input table file, whichever format it is in.
+
+  Args:
+    path: The path of a table snapshot, csv table or RUTHEN file, which may
+      be gzip, bz2 or xz compressed
+    columns: If given, only the columns with these names are converted
+    csv: Whether a file which isn't a snapshot is a csv table
+    table: If not None, the file is opened as a RuthenFile with this default
+      table, so that programs can import from any of its tables
+    cache: An optional TableCache for parsed csv and RUTHEN tables
+    workers: The number of processes to decode a RUTHEN table with
+
+  Returns:
+    A Table, or a RuthenFile when table is given.
+  """
+  if IsTableSnapshot(path):
+    return LoadTableSnapshot(path)
+  if table is not None:
+    return RuthenFile(path, default=table)
+  if csv:
+    return ReadCSVTable(path, columns=columns, cache=cache)
+  return ReadRuthenTable(path, columns=columns, cache=cache, workers=workers)
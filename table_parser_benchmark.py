@@ -0,0 +1,59 @@
+import timeit
+import table_parser
+
+
+def FindSeparationsLoop(line):
+  """The original character by character FindSeparations, for comparison."""
+  separations = []
+  cell_begin=0
+  space_previous=True
+  for i in range(len(line)):
+    if line[i].isspace() and not space_previous:
+      separations.append((cell_begin, i))
+      cell_begin = i
+    space_previous = line[i].isspace()
+  else:
+    if not space_previous:
+      separations.append((cell_begin, len(line)))
+  return separations
+
+
+def WideHeader(columns, width=14):
+  """Returns a RUTHEN style header line with the given number of columns."""
+  return ''.join(('C%d' % i).rjust(width) for i in range(columns)) + '\n'
+
+
+def Report(name, statement, number, **namespace):
+  seconds = min(timeit.repeat(statement, number=number, repeat=3, globals=namespace))
+  print('%-40s %10.1f us' % (name, seconds / number * 1e6))
+
+
+def BenchmarkFindSeparations():
+  for columns in (35, 1000, 5000):
+    line = WideHeader(columns)
+    assert table_parser.FindSeparations(line) == FindSeparationsLoop(line)
+    number = max(1, 20000 // columns)
+    Report('FindSeparations loop, %d columns' % columns,
+           'f(line)', number, f=FindSeparationsLoop, line=line)
+    Report('FindSeparations regex, %d columns' % columns,
+           'f(line)', number, f=table_parser.FindSeparations, line=line)
+
+
+def BenchmarkDecodeNumbers():
+  plain = ['%.2f' % (i * 1.25) for i in range(100000)]
+  padded = [cell.rjust(14).encode('ascii') for cell in plain]
+  separated = ['{:,.2f}'.format(i * 1.25) for i in range(100000)]
+  for name, cells in (('plain str', plain), ('padded bytes', padded),
+                      ('thousands separated', separated)):
+    comma = ',' if isinstance(cells[0], str) else b','
+    empty = comma[:0]
+    Report('replace and float, %s' % name,
+           '[float(e.replace(comma, empty)) for e in cells]', 10,
+           cells=cells, comma=comma, empty=empty)
+    Report('DecodeNumbers, %s' % name,
+           'f(cells)', 10, f=table_parser.DecodeNumbers, cells=cells)
+
+
+if __name__ == '__main__':
+  BenchmarkFindSeparations()
+  BenchmarkDecodeNumbers()
@@ -1,3 +1,11 @@
+import bz2
+import gzip
+import io
+import lzma
+import mmap
+import os
+import shutil
+import tempfile
 import unittest
 import textwrap
 import table_parser
@@ -20,6 +28,14 @@ class TableParserTest(unittest.TestCase):
     self.assertEqual(table_parser.FindSeparations(line),
                      [(0,4), (4, 9), (9, 14)])
                      
+  def testFindSeparationsBytes(self):
+    line = b" 123  456  789 \r\n"
+    self.assertEqual(table_parser.FindSeparations(line),
+                     [(0,4), (4, 9), (9, 14)])
+
+  def testFindSeparationsBlank(self):
+    self.assertEqual(table_parser.FindSeparations("   \n"), [])
+                     
   def testSeparate(self):
     line = " 123  456  789 \r\n"
     separations = [(0,4), (4, 9), (9, 14)]
@@ -32,6 +48,19 @@ class TableParserTest(unittest.TestCase):
     self.assertEqual(table_parser.Separate(line, separations),
                      ['123', '', '789'])
                      
+  def testCompileSeparations(self):
+    line = " 123       789 \r\n"
+    cells = table_parser.CompileSeparations([(0,4), (4, 9), (9, 14)])
+    self.assertEqual(cells(line), (' 123', '     ', '  789'))
+    self.assertEqual(table_parser.CompileSeparations([(0, 4)])(line), (' 123',))
+
+  def testDecodeNumbers(self):
+    self.assertEqual(list(table_parser.DecodeNumbers(['  1.5', '2 '])), [1.5, 2.0])
+    self.assertEqual(list(table_parser.DecodeNumbers([b' 1,000.5', b'2'])), [1000.5, 2.0])
+    self.assertEqual(list(table_parser.DecodeNumbers(())), [])
+    with self.assertRaises(ValueError):
+      table_parser.DecodeNumbers(['1', 'x'])
+
   def testParseRuthenTable(self):
     table = textwrap.dedent("""\
     RUTHEN header
@@ -52,6 +81,246 @@ class TableParserTest(unittest.TestCase):
                      description="Describe\nDescription\n")
     actual = table_parser.ParseRuthenTable(table)
     self.assertEqual(str(actual), str(expected))  # compare strings because == is broken
+
+  def testParseRuthenTableProjected(self):
+    table = textwrap.dedent("""\
+    RUTHEN header
+    Ruthen Model: more header
+    Model Run: more header
+
+    Description
+    BEGIN TABLE
+     Age   Foo  Bar
+      23  0.25 0.50
+      24  0.50 0.75
+     Age - Age""")
+    actual = table_parser.ParseRuthenTable(table, columns={'age', 'bar'})
+    self.assertEqual([c.name for c in actual.columns], ['Age', 'Bar'])
+    self.assertEqual(list(actual.columns[1]), [0.50, 0.75])
+
+  def testParseRuthenTableLazy(self):
+    table = (b"RUTHEN header\r\n\r\n\r\n\r\nDescription\r\nBEGIN TABLE\r\n"
+             b" Age       Foo\r\n  23  1,000.25\r\n  24      0.50\r\n")
+    actual = table_parser.ParseRuthenTable(table, lazy=True)
+    self.assertEqual(len(actual.columns[1]), 2)
+    self.assertFalse(actual.columns[1].IsDecoded())
+    self.assertEqual(list(actual.columns[1]), [1000.25, 0.50])
+    self.assertTrue(actual.columns[1].IsDecoded())
+    self.assertFalse(actual.columns[0].IsDecoded())
+    self.assertEqual(str(actual), str(table_parser.ParseRuthenTable(table)))
+
+  def testReadRuthenTable(self):
+    lines = iter(["RUTHEN header\n", "\n", "\n", "\n",
+                  "BEGIN TABLE\n", " Age  Foo\n", "  23 0.25\n", "  24 0.50\n",
+                  "unread\n", None])
+    actual = table_parser.ReadRuthenTable(lines)
+    self.assertEqual(list(actual.columns[1]), [0.25, 0.50])
+    self.assertIsNone(next(lines))  # reading stops at the end of the table
+
+  def testReadRuthenTablePath(self):
+    path = os.path.join(os.path.dirname(__file__), 'testdata',
+                        'StackedArea-IncomeFlowsByAge.txt')
+    with open(path) as f:
+      expected = table_parser.ParseRuthenTable(f.read())
+    self.assertEqual(str(table_parser.ReadRuthenTable(path)), str(expected))
+
+  def testParseRuthenTableBytes(self):
+    table = (b"RUTHEN header\r\n\r\n\r\n\r\nDescription\r\nBEGIN TABLE\r\n"
+             b" Age       Foo\r\n  23  1,000.25\r\n  24      0.50\r\n")
+    actual = table_parser.ParseRuthenTable(table)
+    self.assertEqual(actual.description, 'Description\n')
+    self.assertEqual([c.name for c in actual.columns], ['Age', 'Foo'])
+    self.assertEqual(list(actual.columns[1]), [1000.25, 0.5])
+
+  def testReadRuthenTableMmap(self):
+    path = os.path.join(os.path.dirname(__file__), 'testdata',
+                        'StackedArea-IncomeFlowsByAge.txt')
+    with open(path, 'rb') as f:
+      mapping = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+    with open(path) as f:
+      expected = table_parser.ReadRuthenTable(f)
+    self.assertEqual(str(table_parser.ReadRuthenTable(mapping)), str(expected))
+    mapping.close()
+
+  def testReadRuthenTableParallel(self):
+    path = os.path.join(os.path.dirname(__file__), 'testdata',
+                        'StackedArea-IncomeFlowsByAge.txt')
+    expected = table_parser.ReadRuthenTable(path, columns=['Age', 'DConsumption'])
+    actual = table_parser._ReadRuthenTableParallel(
+        path, ['Age', 'DConsumption'], workers=2, min_chunk_bytes=1000)
+    self.assertEqual(str(actual), str(expected))
+    self.assertEqual(len(actual.columns[0]), 61)
+
+  def testReadRuthenTableNoHeader(self):
+    with self.assertRaises(ValueError):
+      table_parser.ReadRuthenTable(io.StringIO(''))
+
+  def testParseCSVTable(self):
+    table = 'Age,Foo,Bar\n23,"1,000.5",0.5\n24,2,0.75\n'
+    actual = table_parser.ParseCSVTable(table)
+    self.assertEqual([c.name for c in actual.columns], ['Age', 'Foo', 'Bar'])
+    self.assertEqual(list(actual.columns[1]), [1000.5, 2.0])
+
+  def testParseCSVTableProjected(self):
+    table = 'Age,Foo,Bar\n23,not a number,0.5\n24,2,0.75\n'
+    actual = table_parser.ParseCSVTable(table, columns=['BAR'])
+    self.assertEqual([c.name for c in actual.columns], ['Bar'])
+    self.assertEqual(list(actual.columns[0]), [0.5, 0.75])
+                      
+  def testReadCSVTable(self):
+    lines = ['Age,Foo,Bar\n'] + ['%d,"1,00%d",0.5\n' % (i, i) for i in range(5)]
+    actual = table_parser.ReadCSVTable(iter(lines), columns=['age', 'foo'],
+                                       max_rows=4, chunk_rows=3)
+    self.assertEqual([c.name for c in actual.columns], ['Age', 'Foo'])
+    self.assertEqual(list(actual.columns[0]), [0.0, 1.0, 2.0, 3.0])
+    self.assertEqual(list(actual.columns[1]), [1000.0, 1001.0, 1002.0, 1003.0])
+
+  def testReadCSVTablePath(self):
+    path = os.path.join(os.path.dirname(__file__), 'testdata', 'Delayla.csv')
+    with open(path) as f:
+      expected = table_parser.ParseCSVTable(f.read())
+    self.assertEqual(str(table_parser.ReadCSVTable(path)), str(expected))
+
+
+class CompressedInputTest(unittest.TestCase):
+
+  def setUp(self):
+    self.directory = tempfile.mkdtemp()
+
+  def tearDown(self):
+    shutil.rmtree(self.directory)
+
+  def Compress(self, name, module):
+    source = os.path.join(os.path.dirname(__file__), 'testdata', name)
+    path = os.path.join(self.directory, 'table')  # no telling extension
+    with open(source, 'rb') as f, module.open(path, 'wb') as compressed:
+      compressed.write(f.read())
+    return source, path
+
+  def testRuthen(self):
+    for module in (gzip, bz2, lzma):
+      source, path = self.Compress('StackedArea-IncomeFlowsByAge.txt', module)
+      self.assertEqual(str(table_parser.ReadRuthenTable(path)),
+                       str(table_parser.ReadRuthenTable(source)))
+      self.assertEqual(str(table_parser.RuthenFile(path).Table()),
+                       str(table_parser.ReadRuthenTable(source)))
+
+  def testCSV(self):
+    source, path = self.Compress('Delayla.csv', gzip)
+    self.assertEqual(str(table_parser.ReadCSVTable(path)),
+                     str(table_parser.ReadCSVTable(source)))
+
+
+class RuthenFileTest(unittest.TestCase):
+
+  TABLES = textwrap.dedent("""\
+    RUTHEN header
+    Ruthen Model: more header
+    Model Run: more header
+
+    First title
+    BEGIN TABLE
+     Age   Foo  Bar
+      23  0.25 0.50
+      24  0.50 0.75
+     Age - Age
+
+    Second
+    title
+    BEGIN TABLE
+     Age    Baz
+      23      1
+     Age - Age
+    """)
+
+  def setUp(self):
+    fd, self.path = tempfile.mkstemp()
+    with os.fdopen(fd, 'w') as f:
+      f.write(self.TABLES)
+
+  def tearDown(self):
+    os.remove(self.path)
+
+  def testScan(self):
+    blocks = table_parser.ScanRuthenTables(self.path)
+    self.assertEqual([b.title for b in blocks], ['First title', 'Second\ntitle'])
+    self.assertEqual([b.names for b in blocks], [['Age', 'Foo', 'Bar'], ['Age', 'Baz']])
+    self.assertEqual([b.rows for b in blocks], [2, 1])
+
+  def testFirstTableMatchesReadRuthenTable(self):
+    ruthen_file = table_parser.RuthenFile(self.path)
+    self.assertEqual(str(ruthen_file.Table()),
+                     str(table_parser.ReadRuthenTable(self.path)))
+
+  def testSelectTable(self):
+    ruthen_file = table_parser.RuthenFile(self.path, default='second')
+    self.assertEqual([c.name for c in ruthen_file.Table().columns], ['Age', 'Baz'])
+    self.assertIs(ruthen_file.Block('1'), ruthen_file.blocks[1])
+    table = ruthen_file.Table(0, columns=['bar'])
+    self.assertEqual([c.name for c in table.columns], ['Bar'])
+    self.assertEqual(list(table.columns[0]), [0.50, 0.75])
+    with self.assertRaises(ValueError):
+      ruthen_file.Block(2)
+    with self.assertRaises(ValueError):
+      ruthen_file.Block('third')
+
+
+class TableCacheTest(unittest.TestCase):
+
+  TABLE = 'Age,Foo\n23,0.25\n24,0.5\n'
+
+  def setUp(self):
+    self.directory = tempfile.mkdtemp()
+    self.cache = table_parser.TableCache(self.directory)
+
+  def tearDown(self):
+    shutil.rmtree(self.directory)
+
+  def testHit(self):
+    parsed = table_parser.ParseCSVTable(self.TABLE, cache=self.cache)
+    self.assertEqual(len(os.listdir(self.directory)), 1)
+    cached = table_parser.ParseCSVTable(self.TABLE, cache=self.cache)
+    self.assertEqual(cached, parsed)
+    self.assertIsInstance(cached.columns[0].value, memoryview)
+
+  def testKeyedByColumnsAndContent(self):
+    table_parser.ParseCSVTable(self.TABLE, cache=self.cache)
+    table_parser.ParseCSVTable(self.TABLE, columns=['age'], cache=self.cache)
+    table_parser.ParseCSVTable(self.TABLE + '25,1\n', cache=self.cache)
+    self.assertEqual(len(os.listdir(self.directory)), 3)
+
+  def testReadRuthenTableFromPath(self):
+    path = os.path.join(os.path.dirname(__file__), 'testdata',
+                        'StackedArea-IncomeFlowsByAge.txt')
+    parsed = table_parser.ReadRuthenTable(path, cache=self.cache)
+    cached = table_parser.ReadRuthenTable(path, cache=self.cache)
+    self.assertEqual(str(cached), str(parsed))
+    self.assertEqual(len(os.listdir(self.directory)), 1)
+
+  def testReadCSVTableFromPath(self):
+    path = os.path.join(os.path.dirname(__file__), 'testdata', 'Delayla.csv')
+    parsed = table_parser.ReadCSVTable(path, cache=self.cache)
+    cached = table_parser.ReadCSVTable(path, cache=self.cache)
+    self.assertEqual(str(cached), str(parsed))
+    self.assertEqual(len(os.listdir(self.directory)), 1)
+
+  def testEvictsLeastRecentlyUsed(self):
+    names = []
+    for i in range(3):
+      table_parser.ParseCSVTable(self.TABLE + '%d,0\n' % i, cache=self.cache)
+      name, = set(os.listdir(self.directory)) - set(names)
+      os.utime(os.path.join(self.directory, name), (i, i))
+      names.append(name)
+    oldest = names[0]
+    self.cache.max_bytes = sum(e.stat().st_size for e in os.scandir(self.directory)) - 1
+    self.cache.Evict()
+    self.assertEqual(len(os.listdir(self.directory)), 2)
+    self.assertNotIn(oldest, os.listdir(self.directory))
+
+  def testClear(self):
+    table_parser.ParseCSVTable(self.TABLE, cache=self.cache)
+    self.cache.Clear()
+    self.assertEqual(os.listdir(self.directory), [])
                       
 
 if __name__ == '__main__':
@@ -0,0 +1,114 @@
+"""A binary columnar snapshot format for SAG tables.
+
+A snapshot file consists of:
+  MAGIC, 8 bytes
+  the length of the JSON header as a little-endian uint64
+  the JSON header, holding the column names and descriptions, the row count,
+    the position of the index column and the byte order of the data
+  zero padding to a multiple of 8 bytes
+  each column as a contiguous block of rows float64 values
+
+Loading memory-maps the file and exposes each column as a memoryview into the
+mapping, so no column data is copied or parsed.
+"""
+import json
+import mmap
+import struct
+import sys
+from array import array
+
+from sag_types import Table, Column, Scalar, numpy
+
+MAGIC = b'SAGTBL01'
+_LENGTH = struct.Struct('<Q')
+
+
+def IsTableSnapshot(path):
+  """Returns whether the file at path starts with the snapshot magic."""
+  with open(path, 'rb') as f:
+    return f.read(len(MAGIC)) == MAGIC
+
+
+def _Doubles(column, rows):
+  """Returns a column's values as a contiguous buffer of doubles."""
+  if isinstance(column, Scalar):
+    column = column.Broadcast(rows)
+  value = column.value
+  if numpy is not None and isinstance(value, numpy.ndarray):
+    return numpy.ascontiguousarray(value, dtype=numpy.float64)
+  if isinstance(value, memoryview) and value.format == 'd':
+    return value
+  return array('d', value)
+
+
+def WriteTableSnapshot(table, path):
+  """Writes a table to path as a snapshot."""
+  blocks = list(table.columns)
+  try:
+    index = next(i for i, c in enumerate(blocks) if c is table.index_column)
+  except StopIteration:
+    index = len(blocks)
+    blocks.append(table.index_column)
+  rows = len(table.index_column)
+  header = json.dumps({
+    'description': table.description,
+    'lower_bound': table.lower_bound,
+    'upper_bound': table.upper_bound,
+    'rows': rows,
+    'columns': [{'name': c.name, 'description': c.description}
+                for c in table.columns],
+    'index_column': index,
+    'byteorder': sys.byteorder,
+  }).encode('utf-8')
+  padding = -(len(MAGIC) + _LENGTH.size + len(header)) % 8
+  with open(path, 'wb') as f:
+    f.write(MAGIC)
+    f.write(_LENGTH.pack(len(header)))
+    f.write(header)
+    f.write(b'\0' * padding)
+    for column in blocks:
+      data = _Doubles(column, rows)
+      if len(data) != rows:
+        raise ValueError("Column '%s' has %d rows, expected %d" % (column.name, len(data), rows))
+      f.write(data)
+
+
+def LoadTableSnapshot(path):
+  """Loads a table snapshot by memory-mapping it.
+
+  The returned columns are views into the mapping, which stays open for as
+  long as any of them is referenced.
+  """
+  with open(path, 'rb') as f:
+    if f.read(len(MAGIC)) != MAGIC:
+      raise ValueError("%s is not a table snapshot" % path)
+    header_length, = _LENGTH.unpack(f.read(_LENGTH.size))
+    header = json.loads(f.read(header_length).decode('utf-8'))
+    mapping = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+
+  offset = len(MAGIC) + _LENGTH.size + header_length
+  offset += -offset % 8
+  rows = header['rows']
+  block_count = max(len(header['columns']), header['index_column'] + 1)
+  if len(mapping) < offset + block_count*rows*8:
+    mapping.close()
+    raise ValueError("%s is truncated, expected %d rows of %d columns"
+                     % (path, rows, block_count))
+  data = memoryview(mapping)
+  blocks = []
+  for i in range(block_count):
+    block = data[offset + i*rows*8:offset + (i+1)*rows*8].cast('d')
+    if header['byteorder'] != sys.byteorder:
+      block = array('d', block)
+      block.byteswap()
+    blocks.append(block)
+
+  columns = [Column(block, name=c['name'], description=c['description'])
+             for c, block in zip(header['columns'], blocks)]
+  index = header['index_column']
+  index_column = columns[index] if index < len(columns) else Column(blocks[index])
+  return Table(columns,
+               lower_bound=header['lower_bound'],
+               upper_bound=header['upper_bound'],
+               index_column=index_column,
+               description=header['description'])
@@ -0,0 +1,59 @@
+import os
+import shutil
+import tempfile
+import unittest
+import table_snapshot
+from sag_types import Table, Column
+
+class TableSnapshotTest(unittest.TestCase):
+
+  def setUp(self):
+    self.directory = tempfile.mkdtemp()
+    self.path = os.path.join(self.directory, 'table.sagt')
+
+  def tearDown(self):
+    shutil.rmtree(self.directory)
+
+  def testRoundTrip(self):
+    table = Table([Column([23.0, 24.0], name='Age', description='age'),
+                   Column([0.25, 0.50], name='Foo', description='foo')],
+                  lower_bound=24, description='Describe\n')
+    table_snapshot.WriteTableSnapshot(table, self.path)
+    self.assertTrue(table_snapshot.IsTableSnapshot(self.path))
+    loaded = table_snapshot.LoadTableSnapshot(self.path)
+    self.assertEqual(loaded, table)
+    self.assertIs(loaded.index_column, loaded.columns[0])
+    self.assertEqual(str(loaded), str(table))
+
+  def testColumnsAreMapped(self):
+    table_snapshot.WriteTableSnapshot(Table([Column([1.0, 2.0], name='Age')]), self.path)
+    value = table_snapshot.LoadTableSnapshot(self.path).columns[0].value
+    self.assertIsInstance(value, memoryview)
+    self.assertTrue(value.readonly)
+
+  def testSeparateIndexColumn(self):
+    index = Column([2.0, 1.0], name='Age')
+    table = Table([Column([3.0, 4.0], name='Foo')], index_column=index)
+    table_snapshot.WriteTableSnapshot(table, self.path)
+    loaded = table_snapshot.LoadTableSnapshot(self.path)
+    self.assertEqual(list(loaded.index_column), [2.0, 1.0])
+    self.assertEqual(len(loaded.columns), 1)
+
+  def testTruncated(self):
+    table = Table([Column([1.0, 2.0, 3.0], name='Age'), Column([4.0, 5.0, 6.0], name='Foo')])
+    table_snapshot.WriteTableSnapshot(table, self.path)
+    with open(self.path, 'r+b') as f:
+      f.truncate(os.path.getsize(self.path) - 16)
+    with self.assertRaises(ValueError):
+      table_snapshot.LoadTableSnapshot(self.path)
+
+  def testNotASnapshot(self):
+    with open(self.path, 'w') as f:
+      f.write('RUTHEN header\n')
+    self.assertFalse(table_snapshot.IsTableSnapshot(self.path))
+    with self.assertRaises(ValueError):
+      table_snapshot.LoadTableSnapshot(self.path)
+
+
+if __name__ == '__main__':
+  unittest.main()